@@ -31,13 +31,14 @@ import time
 import re
 
 from threading import Thread
-from queue import Queue
+from queue import Queue, Empty
 
 #sys.path.append("/etc/argon/")
 from sysInfo import *
 from NASlog import *
 from NASconfig import *
 from NASversion import *
+from NASfan import *
 
 isRoot, isArmbian = checkPrivilege()
 print(f"\nisRoot {isRoot}  isArmban {isArmbian}\n")
@@ -55,29 +56,21 @@ if isArmbian:
 # else:
 #    bus=smbus.SMBus(0)
 OLED_ENABLED = False
-MAX_WARNING  = 50
-
-OFF   = 0
-BLINK = 1
-ON    = 2
 
+# Full device rescan period (sec), hotplug events are applied as they come
+RESCAN_PERIOD = 6*3600
 
 #
 # Enable logging
 #
 
-if isArmbian: 
-    import datetime
-    from NAS_SH1306 import *
-    OLED_ENABLED=True
-else:
-    import datetime
-    from NAS_trace import *
-    OLED_ENABLED=True
+# Screens and the OLED backend (NAS_OLED : SH1306, headless or trace)
+from NASscreens import *
+OLED_ENABLED=True
 
 
 devices, sizes   = getDevices()
-names, smartAttrs, sumup = getDevicesSmartsAttr(devices['hd'])
+names, smartAttrs, sumup = getDevicesSmartsAttr(devices['hd'], loadSMARTTTL())
 mapping = getDevicesMapping(devices['hd'])
 
 #
@@ -173,8 +166,8 @@ def watch_key(q):
 
 
 # This function is the thread that monitors temperature and sets the fan speed
-# The value is fed to get_fanspeed to get the new fan speed
-# To prevent unnecessary fluctuations, lowering fan speed is delayed by 30 seconds
+# The value is fed to the fan curves to get the new fan speed
+# To prevent unnecessary fluctuations, lowering fan speed is delayed by FAN_HOLD (30) seconds
 #
 # Location of config file varies based on OS
 #
@@ -185,50 +178,56 @@ def setFanOff ():
 def setFanFlatOut ():
     setFanSpeed (overrideSpeed = 100)
 
+fanController = FanController()
+fanPID        = None
+
 def setFanSpeed (overrideSpeed : int = None, instantaneous : bool = True):
     """
     Set the fanspeed.  Support override (overrideSpeed) with a specific value, and 
-    an instantaneous change.  Some hardware does not like the sudden change, it wants the
-    speed set to 100% THEN changed to the new value.  Not really sure why this is.
+    an instantaneous change.  Otherwise a lower speed is applied once it held for FAN_HOLD
+    seconds, and a stopped fan is kicked at FAN_KICK_SPEED first, some hardware does not like
+    the sudden change.  Never blocks, the caller updates again after fanController.wait().
+    Zones in pid mode are driven by the PID, the PID changes the speed smoothly so its lower
+    speeds are applied at once.
     """
-
-    def getFanSpeed(tempval, configlist):
-        """
-        This function converts the corresponding fanspeed for the given temperature the
-        configutation data is a list of strings in the form "<temperature>:<speed>"
-        """
-        retval = 0
-        if len(configlist) > 0:
-            for k in configlist.keys():
-                if tempval >= float(k):
-                    retval=int(configlist[k])
-                    logDebug( "Temperature (" + str(tempval) + ") >= " + str(k) + " suggesting fanspeed of " + str(retval) )
-        logDebug( "Returning fanspeed of " + str(retval))
-        return retval
-
+    global fanPID
 
     if overrideSpeed is not None:
-        newSpeed = overrideSpeed
+        # Make sure the value is in 0-100 range
+        newSpeed = fanController.force(max([min([100,overrideSpeed]),0]))
     else:
-        newSpeed = max([getFanSpeed(getCPUusage()['temp'], loadCPUFanConfig())
-                       ,getFanSpeed(sumup['maxTemp'], loadHDDFanConfig())
-                       ]
-                      )
-        if newSpeed < setFanSpeed.prevSpeed and not instantaneous:
-            # Pause 30s before speed reduction to prevent fluctuations
-            time.sleep(30)
-
-    # Make sure the value is in 0-100 range
-    newSpeed = max([min([100,newSpeed]),0])
-    if overrideSpeed is not None or (setFanSpeed.prevSpeed != newSpeed):
+        now      = time.monotonic()
+        cpuTemp  = getCPUtemp()
+        # drivetemp is read on every sample, SMART values only when the driver is missing
+        hddTemp  = max(getDevicesTemp(devices['hd']).values(), default = sumup['maxTemp'])
+        cpuMode, hddMode, pidConfig = loadFanControlConfig()
+
+        target = 0
+        errors = []
+        if cpuMode == "pid":
+            errors.append(cpuTemp - pidConfig.cpuTarget)
+        else:
+            target = max(target, loadCPUFanConfig().speed(cpuTemp))
+        if hddMode == "pid":
+            errors.append(hddTemp - pidConfig.hddTarget)
+        else:
+            target = max(target, loadHDDFanConfig().speed(hddTemp))
+
+        if len(errors) > 0:
+            if fanPID is None or fanPID.config != pidConfig:
+                fanPID = FanPID(pidConfig)
+            pidSpeed = fanPID.update(max(errors), now)
+            if pidSpeed >= target:
+                target = pidSpeed
+                instantaneous = True
+
+        logDebug( f"CPU {cpuTemp} HDD {hddTemp} suggesting fanspeed of {target}")
+        newSpeed = fanController.update(max([min([100,target]),0]), now, instantaneous)
+
+    if newSpeed is not None:
         try:
-            if setFanSpeed.prevSpeed == 0:
-                # Spin up to prevent issues on older units                
+            if setFanSpeed.prevSpeed == 0 and newSpeed > 0:
                 print(f"FAN starts")
-                if isArmbian: 
-                    fanPwm.write(0.5)
-                time.sleep(2)
-                
 
             print(f"FAN speed {newSpeed} -  {1-newSpeed/100.0}))")
 
@@ -240,37 +239,33 @@ def setFanSpeed (overrideSpeed : int = None, instantaneous : bool = True):
 
         except IOError:
             logError( "Error trying o update fan speed.")
-            return setFanSpeed.prevspeed
-    return newSpeed
+            # The speed was not applied, the next update tries again
+            fanController.force(setFanSpeed.prevSpeed)
+    return setFanSpeed.prevSpeed
 setFanSpeed.prevSpeed = 0
 
 def temp_check():
     """
-    Main thread for processing the temperature check functonality.  We just try and set the fan speed once
-    a minute.  However we do want to start with the fan *OFF*.
+    Main thread for processing the temperature check functonality.  The temperature is sampled every
+    FAN_PERIOD seconds, sooner when a spin-up kick ends or a lower speed is due.  However we do want to
+    start with the fan *OFF*.
     """
     setFanOff()
     while True:
-        setFanSpeed (instantaneous = False)
-        time.sleep(5)
+        try:
+            setFanSpeed (instantaneous = False)
+        except Exception as e:
+            # Keep the fan under control, the next sample tries again
+            logError( f"Error processing the fan speed exception is {e}")
+        time.sleep(fanController.wait(time.monotonic()))
 #
 # This function is the thread that updates OLED
 #
 def display_loop(readq, writeq):
-    weekdaynamelist = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
-    monthlist = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"]
-    oledscreenwidth = oled_getmaxX()
-
-
     global devices, sizes
     global names, smartAttrs, sumup
     global mapping
 
-    fontwdSml = 6    # Maps to 6x8
-    fontwdReg = 8    # Maps to 8x16
-    fontwdLrg = 10    # Maps to 8x16
-    stdleftoffset = 54
-
     temperature="C"
     temperature = loadTempConfig()
 
@@ -285,36 +280,34 @@ def display_loop(readq, writeq):
     screenid = 0
     screenjogtime = 0
     screenjogflag = 0  # start with screenid 0
-    cpuusagelist = []
-    curlist = []
-    cpuGraph = []
-
-    for i in range (30):
-        cpuGraph.append(0)
 
     tmpconfig=loadOLEDConfig()  
 
-    if "screensaver" in tmpconfig:
-        screensaversec = int(tmpconfig["screensaver"])
-    if "screenduration" in tmpconfig:
-        screenjogtime = int(tmpconfig["screenduration"])
-    if "screenlist" in tmpconfig:
-        screenenabled = tmpconfig["screenlist"].replace("\"","").split(" ")
-        print (f"Screen : {screenenabled}")
-    if "enabled" in tmpconfig:
-        if tmpconfig["enabled"] == "N":
-            screenenabled = []
+    screensaversec = tmpconfig.screensaver
+    screenjogtime  = tmpconfig.screenduration
+    screenenabled  = list(tmpconfig.screenlist)
+    print (f"Screen : {screenenabled}")
+    if not tmpconfig.enabled:
+        screenenabled = []
 
     #
     # Setup some variables to help calculate bandwidth
     #
-    timespan = 1
-    deviceActivityPrev = getDeviceActivty(devices['mnt'])
-    deviceUsage        = getDeviceUsage(devices['mnt'])
-    prevTime = time.clock_gettime_ns(time.CLOCK_MONOTONIC)
+    screen_bandwidth.prev     = getDeviceActivty(devices['mnt'])
+    screen_bandwidth.prevTime = time.clock_gettime_ns(time.CLOCK_MONOTONIC)
+
+    # Kept up to date by the watch_raid thread through readq
+    raidInfo = getRAID()
+
+    lastRescan = time.monotonic()
+
+    # Data shared by the screens, collected values are read again after the refresh of the screen shown
+    snapshot = Snapshot()
+    timeoutcounter = 0
+    refreshing = False
 
     while len(screenenabled) > 0:
-        if len(curlist) == 0 and screenjogflag == 1:
+        if screenPages(curscreen) == 0 and screenjogflag == 1:
             # Reset Screen Saver
             # screensavermode = False
             # print("reset screensaverctr")
@@ -334,352 +327,73 @@ def display_loop(readq, writeq):
         else:
             screenjogflag = 1
 
-        if (int(time.strftime("%M")) == 0):
+        if time.monotonic() - lastRescan >= RESCAN_PERIOD:
+            # Safety net, devices are tracked through the watch_hotplug events
+            lastRescan = time.monotonic()
             devices, sizes   = getDevices()
-            names, smartAttrs, sumup = getDevicesSmartsAttr(devices['hd'])
+            names, smartAttrs, sumup = getDevicesSmartsAttr(devices['hd'], loadSMARTTTL())
             mapping = getDevicesMapping(devices['hd'])            
 
         needsUpdate = False
-        if   curscreen == "cpu": 
-            # CPU Usage
-            
-            try:                
-                cpuusagelist = getCPUusage()                    
-            except:
-                logError( "Error processing information for CPU display")
-
-            
-            oled_loadbg("bgcpu")    
-            avg = cpuusagelist['load']
-
-            oled_writetextaligned(f"{avg:02}%", stdleftoffset, 4, oledscreenwidth-stdleftoffset, 1, fontwdReg)
-
-            if (len(cpuGraph) > 30): cpuGraph = cpuGraph[1:]
-            cpuGraph.append(avg)
-
-            for i in range(len(cpuGraph)):
-                oled_drawfilledrectangle(stdleftoffset+4+i*2, 55, 1, -1*int((cpuGraph[i]/4)),2)
-
-            oled_drawline(stdleftoffset+4, 58, 61, 0,1)
-            oled_drawline(stdleftoffset+4, 23, 61, 0,1)
-            
-            needsUpdate = True
-            curlist = []           
-        elif curscreen == "storage": 
-            # Storage Info           
-            deviceUsage = getDeviceUsage(devices['mnt'])
-            
-            oled_loadbg("bgstorage")
-
-            yoffset = 16
-            for curDev in deviceUsage:
-                # Right column first, safer to overwrite white space
-                oled_writetextaligned(deviceUsage[curDev]['total'], 85, yoffset, oledscreenwidth-85, 2, fontwdSml)
-                oled_writetextaligned(str(deviceUsage[curDev]['percent'])+"%", 60, yoffset, 90-60, 2, fontwdSml)
-                tmpname = curDev
-                if len(tmpname) > 8:
-                    tmpname = tmpname[0:8]
-                oled_writetext(tmpname, 0, yoffset, fontwdSml)
-
-                yoffset = yoffset + 16
-        
-            needsUpdate = True
-            curlist = []          
-        elif curscreen == "bandwidth": 
-            # Bandwidth info            
-            deviceActivity = getDeviceActivty(devices['mnt'])
-            stoptime  = time.clock_gettime_ns(time.CLOCK_MONOTONIC)
-            timespan = (stoptime - prevTime)/1000000000
-            prevTime  = stoptime    
-
-            oled_clearbuffer()
-            oled_writetextaligned( "BANDWIDTH", 0, 0, oledscreenwidth, 1, fontwdSml)
-            oled_writetextaligned( "Write", 90, 16, oledscreenwidth-90, 2, fontwdSml)
-            oled_writetextaligned( "Read",  60, 16, 90-60,              2, fontwdSml)
-            oled_writetext( "Device", 0, 16, fontwdSml )
-
-            itemcount = 2
-            yoffset   = 32
-         
-            for device in deviceActivity:
-                curr = deviceActivity[device]
-                prev = deviceActivityPrev[device]
-                '''
-                if device == 'md0':
-                    print(f" WRiTE {device}  curr:{curr['write']}  prev:{prev['write']} speed {(curr['write']-prev['write'])/timespan} Time:{timespan}")
-                    print(f" READ  {device}  curr:{curr['read']}   prev:{prev['read']}  speed {(curr['read']-prev['read'])/timespan} Time:{timespan}")
-                '''
-
-                bandwidth = int(((curr['write']-prev['write']))/(timespan*2))
-                oled_writetextaligned( kbstr(bandwidth,False), 90, yoffset, oledscreenwidth-90, 2, fontwdSml )
-
-                bandwidth = int(((curr['read']-prev['read']))/(timespan*2))
-                oled_writetextaligned( kbstr(bandwidth,False), 60, yoffset, 90-60, 2, fontwdSml )
-
-                oled_writetext( device, 0, yoffset, fontwdSml )
-                itemcount = itemcount - 1
-                yoffset   = yoffset + 16            
-            
-            deviceActivityPrev  = deviceActivity         
-            needsUpdate = True
-            curlist = []
-        elif curscreen == "raid":  
-            # Raid Info
-            
-            raid = getRAID()
-            raidName = list(raid.keys())[0]
-            raid = raid[raidName]
-            
-            oled_loadbg("bgraid")
-            oled_writetextaligned(raidName, 0, 0, stdleftoffset, 1, fontwdSml)
-            oled_writetextaligned(raid["type"], 0, 8, stdleftoffset, 1, fontwdSml)
-            if raidName in sizes:
-                oled_writetextaligned(sizes[raidName], 0, 56, stdleftoffset, 1, fontwdSml)
-            else:
-                oled_writetextaligned("----", 0, 56, stdleftoffset, 1, fontwdSml)
-            oled_writetext( raid['status'], stdleftoffset, 4, fontwdReg )
-            if raid['recovery'] != None:
-                oled_writetext(f"{raid['recovery']['percentage']}% at {raid['recovery']['speed']}", stdleftoffset, 16, fontwdSml)
-            oled_writetext(f"Active  : {raid['disc'][0]}", stdleftoffset, 28, fontwdSml)
-            oled_writetext(f"Working : {raid['disc'][1]}", stdleftoffset, 38, fontwdSml)
-            oled_writetext(f"Failed  : {raid['disc'][0]-raid['disc'][1]}", stdleftoffset, 48, fontwdSml)
-            # oled_writetext("Failed  : "+str(int(tmpitem["info"]["failed"]))+"/"+str(int(tmpitem["info"]["devices"])), stdleftoffset, 48, fontwdSml)
-            needsUpdate = True            
-        elif curscreen == "smart": 
-            # Raid Info         
-            oled_loadbg("bgdisc")
-            led = {}
-               
-            if    sumup['error']   >  0: 
-                msg = "ERROR"
-            elif  sumup['warning'] >  MAX_WARNING: 
-                msg = "WARNING"
-            else: 
-                msg = "- OK -"  
-        
-
-            yoffset = 0
-            for dev in smartAttrs:
-                oled_writetext(dev, 56, yoffset, fontwdSml)
-                oled_writetextaligned(f"{smartAttrs[dev]['warning']}",75,yoffset,20, 2, fontwdSml)    
-                oled_writetextaligned(f"{smartAttrs[dev]['error']}",90,yoffset,30, 2, fontwdSml)    
-                yoffset += 12
-
-            '''
-            oled_writetextaligned(msg, stdleftoffset, 8, oledscreenwidth-stdleftoffset, 1, fontwdReg)
-
-                
-            
-            if msg == "- OK -":
-               
-                
-                devStb = getDevicesStandby(devices['hd'])
-                idle = 0
-                for stb in devStb:
-                    if devStb[stb]: idle += 1
-
-                oled_writetextaligned(f"Idle   {idle}", stdleftoffset, 36, oledscreenwidth-stdleftoffset, 1, fontwdSml)
-                oled_writetextaligned(f"Active {len(devStb)-idle}", stdleftoffset, 48, oledscreenwidth-stdleftoffset, 1, fontwdSml)
-                
-
-            if msg == "WARNING":
-                nb = 0
-                maxWarn = 0
-                readErr = 0
-                seekErr = 0
-                
-                for drive in smartAttrs:
-                    led[mapping[drive]] = OFF
-
-                    if smartAttrs[drive]['warning'] > MAX_WARNING: 
-                        nb += 1    
-                        led[mapping[drive]] = BLINK
-             
-                    if smartAttrs[drive]['warning'] > maxWarn: maxWarn = smartAttrs[drive]['warning'] 
-                    readErr  += smartAttrs[drive]['1']
-                    seekErr  += smartAttrs[drive]['7']
-
-                oled_writetextaligned(f"{nb} disc ({maxWarn})", stdleftoffset, 36, oledscreenwidth-stdleftoffset, 1, fontwdSml)
-
-                txt = "???"
-                if (readErr> 0) and (seekErr == 0): txt = "ReadErr"
-                if (readErr==0) and (seekErr == 0): txt = "SeekErr"
-                if (readErr >0) and (seekErr >  0): txt = "Read & Seek"                    
-                oled_writetextaligned(txt, stdleftoffset, 48, oledscreenwidth-stdleftoffset, 1, fontwdSml)
-
-            if msg == "ERROR":                    
-                nb = 0
-                errStr = []
-                for drive in smartAttrs:
-                    led[mapping[drive]] = OFF
-                    if smartAttrs[drive]['error'] > 0: 
-                        nb += 1
-                        led[mapping[drive]] = ON
-                        
-                    errStr.append(str(smartAttrs[drive]['error']))
-                
-                oled_writetextaligned(f"{nb} disc", stdleftoffset, 36, oledscreenwidth-stdleftoffset, 1, fontwdSml)
-                oled_writetextaligned("/".join(errStr), stdleftoffset, 48, oledscreenwidth-stdleftoffset, 1, fontwdSml)
-
-            '''            
-            writeq.put((msg,led))
-            needsUpdate = True
-            screenjogflag = 1
-            curlist=[]
-        elif curscreen == "fan":   
-            # RAM 
-            try:
-                oled_loadbg("bgfan")
-                speed = setFanSpeed.prevSpeed
-                if speed == 0:
-                    oled_writetextaligned(f"OFF", stdleftoffset, 24, oledscreenwidth-stdleftoffset, 1, fontwdReg)    
-                elif speed == 100:
-                    oled_writetextaligned(f"MAX", stdleftoffset, 24, oledscreenwidth-stdleftoffset, 1, fontwdReg)    
-                else:
-                    oled_writetextaligned(f"Speed", stdleftoffset, 12, oledscreenwidth-stdleftoffset, 1, fontwdReg)
-                    oled_writetextaligned(f"{speed}%", stdleftoffset, 32, oledscreenwidth-stdleftoffset, 1, fontwdReg)
-                
-                needsUpdate = True
-            except:
-                logError( "Error processing information for fan display")
-                needsUpdate = False
-                # Next page due to error/no data
-                screenjogflag = 1
-        elif curscreen == "ram":   
-            # RAM 
-            try:
-                oled_loadbg("bgram")
-                ram = getRAMusage()
-                oled_writetextaligned(f"{ram['free']}%", stdleftoffset, 8, oledscreenwidth-stdleftoffset, 1, fontwdReg)
-                oled_writetextaligned("of", stdleftoffset, 24, oledscreenwidth-stdleftoffset, 1, fontwdReg)
-                oled_writetextaligned(f"{ram['sizeGB']}GB", stdleftoffset, 40, oledscreenwidth-stdleftoffset, 1, fontwdReg)
-                needsUpdate = True
-            except:
-                logError( "Error processing information for RAM display")
-                needsUpdate = False
-                # Next page due to error/no data
-                screenjogflag = 1
-        elif curscreen == "temp": 
-            # Temp
-        
-            oled_loadbg("bgtemp")
-            
-            maxcval = sumup['maxTemp']
-            mincval = sumup['minTemp']
-            cpucval = getCPUusage()['temp']
-            
-
-            alltempobj = {"cpu ": cpucval,"hdd":None, " min": mincval, " max": maxcval}
-
-            # Update max C val to CPU Temp if necessary
-            if maxcval < cpucval:
-                maxcval = cpucval
-
-            displayrowht = 8
-            displayrow = 8
-            for curdev in alltempobj:
-                if alltempobj[curdev] != None :
-                    if temperature == "C":
-                        # Celsius
-                        tmpstr = str(alltempobj[curdev])
-                        if len(tmpstr) > 4:
-                            tmpstr = tmpstr[0:4]
-                    else:
-                        # Fahrenheit
-                        tmpstr = str(32+9*(alltempobj[curdev])/5)
-                        if len(tmpstr) > 5:
-                            tmpstr = tmpstr[0:5]
-
-                    oled_writetext(curdev.upper()+": "+ tmpstr+ chr(186) +temperature, stdleftoffset, displayrow, fontwdSml)
-                    if (curdev[0] == " "):
-                        displayrow = displayrow + displayrowht*1.5
-                    else:
-                        displayrow = displayrow + displayrowht*2
-                else:
-                    oled_writetext(curdev.upper(), stdleftoffset, displayrow, fontwdSml)
-                    displayrow = displayrow + displayrowht*1.5
-
-                    
-            
-            # Temperature Bar: 40C is min, 80C is max
-            maxht = 21
-            barht = int(maxht*(maxcval-40)/40)
-            if barht > maxht:
-                barht = maxht
-            elif barht < 1:
-                barht = 1
-            oled_drawfilledrectangle(24, 20+(maxht-barht), 3, barht, 2)
-
-            needsUpdate = True
-            curlist = []
-        elif curscreen == "ip":  
-            # IP Address
-            try:
-                if len(curlist) == 0:
-                    curlist = list (getIPlist().items())
-            except:
-                logError( "Error processing information for IP display")
-                curlist = []
-
-            if len(curlist) > 0:
-                item = curlist.pop(0)
-                oled_loadbg("bgip")
-                oled_writetextaligned(item[0], 0, 0, oledscreenwidth, 1, fontwdReg)
-                oled_writetextaligned(item[1], 0,16, oledscreenwidth, 1, fontwdReg)
-                needsUpdate = True
-            else:
-                needsUpdate = False
-                # Next page due to error/no data
-                screenjogflag = 1
-        elif curscreen == "disc":
-            needsUpdate = True    
-        elif curscreen == "reboot":  
+        needsFlush  = True
+        if curscreen == "reboot":  
 
             oled_writetext('Click : Reboot', 20, 20, fontwdSml)
             oled_writetext('Twise : Shutdown', 20, 32, fontwdSml)
 
             devices, sizes   = getDevices()
-            names, smartAttrs, sumup = getDevicesSmartsAttr(devices['hd'])
+            names, smartAttrs, sumup = getDevicesSmartsAttr(devices['hd'], loadSMARTTTL())
             mapping = getDevicesMapping(devices['hd'])       
 
             curscreen = "reboot-"
             needsUpdate = True
-        elif curscreen == 'clock': # display time            
-            oled_loadbg("bgtime")
-            # Date and Time HH:MM
-            curtime = datetime.datetime.now()
-            
-            # Month/Day
-            outstr = str(curtime.day).strip()
-            if len(outstr) < 2:
-                outstr = " "+outstr
-            outstr = monthlist[curtime.month-1]+" "+outstr
-            oled_writetextaligned(outstr, stdleftoffset, 8, oledscreenwidth-stdleftoffset, 1, fontwdReg)
-
-            # Day of Week
-            oled_writetextaligned(weekdaynamelist[curtime.weekday()], stdleftoffset, 24, oledscreenwidth-stdleftoffset, 1, fontwdReg)
-
-            # Time
-            outstr = str(curtime.minute).strip()
-            if len(outstr) < 2:
-                outstr = "0"+outstr
-            outstr = str(curtime.hour)+":"+outstr
-            if len(outstr) < 5:
-                outstr = "0"+outstr
-            oled_writetextaligned(outstr, stdleftoffset, 40, oledscreenwidth-stdleftoffset, 1, fontwdReg)
+            screenInvalidate()
+        elif curscreen in SCREENS:
+            snapshot.update({'devices'    : devices,
+                             'sizes'      : sizes,
+                             'smartAttrs' : smartAttrs,
+                             'sumup'      : sumup,
+                             'raidInfo'   : raidInfo,
+                             'fanSpeed'   : setFanSpeed.prevSpeed,
+                             'temperature': temperature,
+                             'ledq'       : writeq})
+            try:
+                needsUpdate, needsFlush = drawScreen(curscreen, snapshot, refreshing)
+            except Exception:
+                logError( f"Error processing information for {curscreen} display")
+                oled_reset()
+                screenInvalidate()
+                needsUpdate = False
 
-            needsUpdate = True
+            if not needsUpdate:
+                # Next page due to error/no data
+                screenjogflag = 1
         if needsUpdate == True:
-            # Update screen if not screen saver mode
-            oled_flushimage(prevscreen != curscreen)
-            oled_reset()
-
-            timeoutcounter = 0
+            # Update screen if not screen saver mode, unless the frame on display is still current
+            if needsFlush:
+                oled_flushimage(prevscreen != curscreen)
+                oled_reset()
+
+            # A refresh of the screen keeps counting its display time
+            if not refreshing:
+                timeoutcounter = 0
+            refreshing = False
+            refreshcounter = 0
             while timeoutcounter<screenjogtime or screenjogtime == 0:
                 qdata = ""
-                if readq.empty() == False:
-                    qdata = readq.get()
+                try:
+                    # Wait for a key for up to 1 sec, the sampler thread keeps the CPU load up to date
+                    qdata = readq.get(timeout = 1)
                     print(f"qData {qdata}")
+                except Empty:
+                    pass
+
+                # Mounting a filesystem sends no uevent, the mount table is polled instead
+                if updateMounts(devices, sizes):
+                    logInfo( f"Mounted devices {devices['mnt']}")
+                    mapping = getDevicesMapping(devices['hd'])
+                    names, smartAttrs, sumup = getDevicesSmartsAttr(devices['hd'], loadSMARTTTL())
+                    snapshot.expire()
                         
                 if (qdata == "click") :
 
@@ -706,6 +420,39 @@ def display_loop(readq, writeq):
                 elif (qdata == "press") :                    
                     curscreen = "reboot"
                     break                
+                elif (type(qdata) is tuple and qdata[0] == "hotplug") :
+                    action, device = qdata[1], qdata[2]
+                    logInfo( f"Device {device} {action}")
+
+                    # Only the device of the event is read again, SMART values of the others come from the cache
+                    updateDevices(devices, sizes, action, device)
+                    mapping.pop(device, None)
+                    if device in devices['hd']:
+                        mapping.update(getDevicesMapping([device]))
+                    names, smartAttrs, sumup = getDevicesSmartsAttr(devices['hd'], loadSMARTTTL())
+                    snapshot.expire()
+                elif (type(qdata) is tuple and qdata[0] == "raid") :
+                    prevRaidInfo = raidInfo
+                    raidInfo = qdata[1]
+                    logInfo( f"RAID state {raidInfo}")
+                    snapshot.expire()
+
+                    # Show the raid screen as soon as an array leaves the clean state
+                    showRaid = False
+                    for md in (raidInfo or {}):
+                        prevStatus = (prevRaidInfo or {}).get(md, {}).get('status')
+                        if raidInfo[md]['status'] != 'clean' and raidInfo[md]['status'] != prevStatus:
+                            logWarning( f"RAID {md} is {raidInfo[md]['status']}")
+                            showRaid = True
+
+                    if (showRaid or curscreen == "raid") and "raid" in screenenabled and curscreen != "reboot-":
+                        screenid = screenenabled.index("raid")
+                        screenRewind("raid")
+                        screenjogflag = 0
+                        screensavermode = False
+                        screensaverctr = 0
+                        oled_power(True)
+                        break
                 else:
                     screensaverctr = screensaverctr + 1
                     #print(f"screensaverctr : {screensaverctr}, screensaversec : {screensaversec}, screenSave {screensavermode}")
@@ -713,17 +460,13 @@ def display_loop(readq, writeq):
                         screensavermode = True
                         oled_power(False)
 
-
-                    if timeoutcounter == 0:
-                        # Use 1 sec sleep get CPU usage
-                        cpuusagelist = getCPUusage(1)
-                    else:
-                        time.sleep(1)
-
                     timeoutcounter = timeoutcounter + 1
-                    if timeoutcounter >= 60 and screensavermode == False:
-                        # Refresh data every minute, unless screensaver got triggered
+                    refreshcounter = refreshcounter + 1
+                    if refreshcounter >= screenRefresh(curscreen) and screensavermode == False and \
+                       (timeoutcounter < screenjogtime or screenjogtime == 0):
+                        # Draw again once the screen data may have changed, unless screensaver got triggered
                         screenjogflag = 0
+                        refreshing = True
                         break
 
             
@@ -738,6 +481,8 @@ def display_defaultimg():
     oled_loadbg("bgdefault")
     oled_flushimage()
     oled_reset()    
+    # The service may stop right after, the frame must be sent
+    oled_sync()
     # oled_fill(0)
     
 
@@ -770,6 +515,8 @@ if len(sys.argv) > 1:
         try:
             logInfo( f"NAS service version {NAS_VERSION} starting.")
 
+            startCPUSampler()
+
             keyQ = Queue()
             ledQ = Queue()
             t1 = Thread(target = watch_key, args =(keyQ, ))
@@ -778,12 +525,16 @@ if len(sys.argv) > 1:
             if OLED_ENABLED == True:
                 t3 = Thread(target = display_loop, args =(keyQ, ledQ, ))
                 t4 = Thread(target = ledDriver   , args =(ledQ, ))
+                t5 = Thread(target = watch_raid  , args =(keyQ, ), daemon = True)
+                t6 = Thread(target = watch_hotplug, args =(keyQ, ), daemon = True)
 
             t1.start()
             t2.start()        
             if OLED_ENABLED == True:
                 t3.start()
                 t4.start()
+                t5.start()
+                t6.start()
 
             #ledQ.join()
         except Exception as e:
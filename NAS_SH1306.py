@@ -6,13 +6,12 @@ import datetime
 import math
 
 import os
+import threading
 
 from luma.core.interface.serial import i2c
-from luma.core.render import canvas
 from luma.oled.device import sh1106
 
-from PIL import Image
-from PIL import ImageFont
+from NASrender import *
 
 #import smbus
 #import RPi.GPIO as GPIO
@@ -24,8 +23,6 @@ from PIL import ImageFont
 #    bus=smbus.SMBus(0)
 
 
-OLED_WD=128
-OLED_HT=64
 OLED_SLAVEADDRESS=0x6a
 ADDR_OLED=0x3c
 
@@ -39,150 +36,99 @@ oled_imagebuffer = [0] * OLED_BUFFERIZE
 serial = i2c(port=7, address=0x3C)
 device = sh1106(serial)
 
-mgr = canvas(device)
-    
-exit = type(mgr).__exit__
-draw = type(mgr).__enter__(mgr)
-
-fontSmall  = ImageFont.truetype("fonts/ProggyTiny.ttf", 16)
-fontMedium = ImageFont.truetype("fonts/FreePixel.ttf", 16)
-fontLarge = ImageFont.truetype("fonts/ProggyTiny.ttf", 22)
-debug = False
-
+# Last frame sent to the device, one bytearray by 8 pixel rows page.  luma clears the display
+# when the device is created
+oled_sentpages = [bytearray(OLED_WD) for page in range(OLED_NUMPAGES)]
 
-def oled_getmaxY():
-    return OLED_HT
+# Flush counters : frames flushed, frames skipped (no change), frames dropped (replaced by a newer
+# one before the flush worker got to them), bytes sent in total and by the last frame
+oled_stats = {'frames':0, 'skipped':0, 'dropped':0, 'bytes':0, 'lastbytes':0}
 
-def oled_getmaxX():
-    return OLED_WD
+# Latest frame rendered, waiting for the flush worker.  A newer frame replaces it
+oled_nextpages = None
+oled_flushing  = False
+oled_flushcond = threading.Condition()
 
-def oled_loadbg(bgname):
-    if (debug): print(f"-- oled_loadbg ({bgname})")
-    if bgname == "bgblack":
-        oled_clearbuffer()
-        return
-    elif bgname == "bgwhite":
-        oled_clearbuffer(1)
-        return
-    try:
-        logo = Image.open("oled/"+bgname+".png")
-        draw.bitmap((0, 0), logo, fill="white")
+# The flush worker and the power commands share the bus
+oled_i2clock = threading.Lock()
 
-    except FileNotFoundError:
-        oled_clearbuffer()
-
-
-def oled_clearbuffer(value = 0):
-    if (debug): print(f"-- oled_clearbuffer {value}")
-    device.clear()
-    return
-
-
-def oled_writebyterow(x,y,bytevalue, mode = 0):
-    if (debug): print(f"-- oled_writebyterow {x},{y}, {bytevalue}, {mode}")
-
-    return 
-
-
-def oled_writebuffer(x,y,value, mode = 0):
-    if (debug): print(f"-- oled_writebuffer {x},{y}, {value}, {mode}")
-    return 
+debug = False
 
 
 def oled_fill(value):
     oled_clearbuffer(value)
     oled_flushimage()
 
+def oled_sendpage(page, first, data):
+    # The SH1106 RAM is 132 columns wide, the panel starts at column 2
+    column = first + 2
+    with oled_i2clock:
+        device.command(0xB0 + page, column & 0x0F, 0x10 | (column >> 4))
+        device.data(list(data))
+
+def oled_flushpages(pages):
+    """
+    Send the pages that differ from the last frame sent, only the changed column range of a page
+    is written.  Return the number of bytes sent (commands and data).
+    """
+    return diffPages(pages, oled_sentpages, oled_stats, oled_sendpage)
+
+def oled_getstats():
+    return dict(oled_stats)
+
+def oled_flushworker():
+    """
+    Send the latest frame rendered, I2C writes take tens of ms and must not hold display_loop
+    """
+    global oled_nextpages, oled_flushing
+    while True:
+        with oled_flushcond:
+            while oled_nextpages is None:
+                oled_flushing = False
+                oled_flushcond.notify_all()
+                oled_flushcond.wait()
+            pages = oled_nextpages
+            oled_nextpages = None
+            oled_flushing  = True
+
+        oled_flushpages(pages)
+
 def oled_flushimage(hidescreen = True):
+    global oled_nextpages
     if (debug): print(f"-- oled_flushimage {hidescreen}")
 
-    exit(mgr, None, None, None)
-
-
-def oled_flushblock(xoffset, yoffset):
-    if (debug): print(f"-- oled_flushblock {xoffset},{yoffset}")
-    return
-
-
-def oled_drawfilledrectangle(x, y, wd, ht, mode = 0):
-    if (debug): print(f"-- oled_drawfilledrectangle ({x},{y}) - ({wd},{ht}) # {mode}")
-
-    draw.rectangle(xy=[x,y,x+wd,y+ht],outline=mode)
-
-    return
-    
-def oled_drawline(x, y, wd, ht, mode = 0):
-    if (debug): print(f"-- oled_drawline ({x},{y}) - ({wd},{ht}) # {mode}")
-
-    draw.line(xy=[x,y,x+wd,y+ht],fill = 1)
-
-    return
-
+    # The frame is converted here, the framebuffer can be drawn again as soon as we return
+    pages = imageToPages(device.preprocess(framebuffer.image))
+    with oled_flushcond:
+        if oled_nextpages is not None:
+            oled_stats['dropped'] += 1
+        oled_nextpages = pages
+        oled_flushcond.notify_all()
 
+def oled_sync(timeout = 5):
+    """
+    Wait until the last frame rendered is on the display
+    """
+    with oled_flushcond:
+        oled_flushcond.wait_for(lambda: oled_nextpages is None and not oled_flushing, timeout)
 
-def oled_writetextaligned(textdata, x, y, boxwidth, alignmode, charwd = 6, mode = 0):
-    leftoffset = 0
-    if alignmode == 1:
-        # Centered
-        leftoffset = (boxwidth-len(textdata)*charwd)>>1
-    elif alignmode == 2:
-        # Right aligned
-        leftoffset = (boxwidth-len(textdata)*charwd)
-
-    oled_writetext(textdata, x+leftoffset, y, charwd, mode)
-    
-
-def oled_writetext(textdata, x, y, charwd = 6, mode = 0):
-    if (debug): print(f"-- oled_writetext ({x},{y}) \"{textdata}\", size={charwd}")
-    if (charwd == 6):
-        fnt = fontSmall
-    elif (charwd == 8):        
-        fnt = fontMedium
-    else:
-        fnt = fontLarge
+oled_flushthread = threading.Thread(target = oled_flushworker, daemon = True)
+oled_flushthread.start()
 
-    draw.text(xy=(x,y), text=textdata, fill="white", font=fnt)
 
-    
-
-def oled_fastwritetext(textdata, x, y, charht, charwd, fontbytes, mode = 0):
-    if (debug): print("-- oled_fastwritetext")
+def oled_flushblock(xoffset, yoffset):
+    if (debug): print(f"-- oled_flushblock {xoffset},{yoffset}")
     return
 
 
 def oled_power(turnon = True):
     if (debug): print(f"-- oled_power {turnon}")
 
-    if (turnon):
-        device.show()
-    else:
-        device.hide()
-
-    return
-
-
-
-def oled_inverse(enable = True):
-    if (debug): print("- oled_inverse")
-    return
-
-
-def oled_fullwhite(enable = True):
-    if (debug): print("-- oled_fullwhite")
-    return 
-
-
-
-def oled_reset():
-    if (debug): print("-- oled_reset")
-
-    global mgr, exit, draw
-
-    del mgr
-
-    mgr = canvas(device)
-    exit = type(mgr).__exit__
-    draw = type(mgr).__enter__(mgr)
+    with oled_i2clock:
+        if (turnon):
+            device.show()
+        else:
+            device.hide()
 
     return
 
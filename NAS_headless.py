@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+
+#
+# Headless OLED backend, same API as NAS_SH1306 without the I2C device.  Frames are rendered
+# in memory, they can be dumped as PNG/PBM files (NAS_OLED_DUMP=<directory>,
+# NAS_OLED_FORMAT=png|pbm) or compared through their hash.
+#
+
+import os
+import hashlib
+
+from NASrender import *
+
+
+# Last frame "sent", to count the bytes that the SH1106 backend would send
+oled_sentpages = [bytearray(OLED_WD) for page in range(OLED_NUMPAGES)]
+
+# Flush counters : frames flushed, frames skipped (no change), frames dropped (always 0, flushes
+# are synchronous), bytes sent in total and by the last frame
+oled_stats = {'frames':0, 'skipped':0, 'dropped':0, 'bytes':0, 'lastbytes':0}
+
+oled_dumpdir    = os.environ.get("NAS_OLED_DUMP")
+oled_dumpformat = os.environ.get("NAS_OLED_FORMAT", "png")
+oled_flushcount = 0
+oled_powered    = True
+
+debug = False
+
+
+def oled_fill(value):
+    oled_clearbuffer(value)
+    oled_flushimage()
+
+def oled_getstats():
+    return dict(oled_stats)
+
+def oled_framehash():
+    return hashlib.sha1(framebuffer.image.tobytes()).hexdigest()
+
+def oled_flushimage(hidescreen = True):
+    global oled_flushcount
+    if (debug): print(f"-- oled_flushimage {hidescreen}")
+
+    diffPages(imageToPages(framebuffer.image), oled_sentpages, oled_stats)
+
+    if oled_dumpdir:
+        framebuffer.image.save(f"{oled_dumpdir}/frame{oled_flushcount:06}.{oled_dumpformat}")
+    oled_flushcount += 1
+
+
+def oled_flushblock(xoffset, yoffset):
+    if (debug): print(f"-- oled_flushblock {xoffset},{yoffset}")
+    return
+
+
+def oled_power(turnon = True):
+    global oled_powered
+    if (debug): print(f"-- oled_power {turnon}")
+
+    oled_powered = turnon
+
+    return
@@ -60,6 +60,19 @@ def oled_fill(value):
 def oled_flushimage(hidescreen = True):
     if (debug): print(f"-- oled_flushimage {hidescreen}")
 
+def oled_sync(timeout = 5):
+    return
+
+def oled_getframe():
+    # Nothing is drawn, there is no frame to keep
+    return None
+
+def oled_putframe(frame):
+    if (debug): print("-- oled_putframe")
+
+def oled_getstats():
+    return {'frames':0, 'skipped':0, 'dropped':0, 'bytes':0, 'lastbytes':0}
+
 def oled_flushblock(xoffset, yoffset):
     if (debug): print(f"-- oled_flushblock {xoffset},{yoffset}")
     return
@@ -75,14 +88,17 @@ def oled_drawline(x, y, wd, ht, mode = 0):
 
 
 
+def oled_textwidth(textdata, charwd = 6):
+    return len(textdata)*charwd
+
 def oled_writetextaligned(textdata, x, y, boxwidth, alignmode, charwd = 6, mode = 0):
     leftoffset = 0
     if alignmode == 1:
         # Centered
-        leftoffset = (boxwidth-len(textdata)*charwd)>>1
+        leftoffset = (boxwidth-oled_textwidth(textdata, charwd))>>1
     elif alignmode == 2:
         # Right aligned
-        leftoffset = (boxwidth-len(textdata)*charwd)
+        leftoffset = (boxwidth-oled_textwidth(textdata, charwd))
 
     oled_writetext(textdata, x+leftoffset, y, charwd, mode)
     
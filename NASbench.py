@@ -0,0 +1,497 @@
+#!/usr/bin/python3
+
+#
+# Benchmarks and checks, run against the probe/ fixtures, the exit status is 1 when a check fails
+#
+#   python3 NASbench.py [smart] [sysfs] [pages] [screens] [fan] [fancontrol]
+#
+import os
+import sys
+import time
+import json
+import glob
+import tracemalloc
+import subprocess
+import tempfile
+import configparser
+
+import sysInfo
+import NASconfig
+import NASrender
+import NASfan
+
+
+# Checks that failed, the run exits with status 1 when there are any
+failures = []
+
+def _check(ok, message):
+    if not ok:
+        failures.append(message)
+        print(f"  FAILED {message}")
+    return ok
+
+
+def _timeit(func, arg, loops):
+    start = time.perf_counter()
+    for i in range(loops):
+        func(arg)
+    return (time.perf_counter() - start) / loops
+
+
+def _smartTextToJSON(out):
+    """
+    Build the smartctl -A -l scttempsts -j equivalent of a text probe, the whole attribute table is
+    converted so the JSON payload is close to the real one.
+    """
+    table = []
+    hours = 0
+    temp = None
+    for line in out.split("\n"):
+        fields = line.split(None, 9)
+        if len(fields) < 10 or not fields[0].isdigit():
+            continue
+        table.append({'id'         : int(fields[0]),
+                      'name'       : fields[1],
+                      'value'      : int(fields[3]),
+                      'worst'      : int(fields[4]),
+                      'thresh'     : int(fields[5]),
+                      'when_failed': "" if fields[8] == "-" else fields[8],
+                      'flags'      : {'value': int(fields[2], 16), 'string': fields[2], 
+                                      'prefailure': fields[6] == "Pre-fail", 
+                                      'updated_online': fields[7] == "Always"},
+                      'raw'        : {'value': sysInfo._smartRawInt(fields[9]), 'string': fields[9]}})
+        if fields[0] == "9":
+            hours = sysInfo._smartRawInt(fields[9])
+        if fields[0] == "194":
+            temp = sysInfo._smartRawInt(fields[9])
+
+    data = {'json_format_version': [1, 0],
+            'smartctl': {'version': [7, 2], 'exit_status': 0},
+            'device': {'name': "/dev/sdX", 'type': "sat", 'protocol': "ATA"},
+            'ata_smart_attributes': {'revision': 16, 'table': table},
+            'power_on_time': {'hours': hours}}
+    if temp is not None:
+        data['temperature'] = {'current': temp}
+
+    return json.dumps(data, indent = 2)
+
+
+def _parseSmartSplitAll(out):
+    # Former parser : every line split on whitespace, raw value read by position
+    names = {}
+    values = {}
+    for line in sysInfo._splitOutput(out)[5:]:
+        if line[0] in sysInfo.SMART_ATTRS:
+            names[line[0]] = line[1]
+            values[line[0]] = int(line[9])
+    return (names, values)
+
+
+def benchSmartParse(loops = 2000):
+    """
+    Parse time per drive of the smartctl text table and of the JSON output, both parsers must
+    return the same values.  Known values of the probe/ fixtures are checked first.
+    """
+    print("SMART parse time per drive")
+    with open("probe/sda.smart.txt") as f:
+        sdaText = f.read()
+    expected = [("sdb", "1", 10), ("sde", "197", 1)]
+    for device, attr, value in expected:
+        with open(f"probe/{device}.smart.txt") as f:
+            values = sysInfo._parseSmartText(f.read())[1]
+        _check(values.get(attr) == value, f"{device} attribute {attr} is {values.get(attr)} expected {value}")
+    minMaxText = sdaText.replace("Always       -       30\n", "Always       -       35 (Min/Max 20/45)\n")
+    for name, parse, out in [("text", sysInfo._parseSmartText, minMaxText),
+                             ("json", sysInfo._parseSmartJSON, _smartTextToJSON(minMaxText))]:
+        temp = parse(out)[1].get('194')
+        _check(temp == 35, f"{name} raw value \"35 (Min/Max 20/45)\" read as {temp} expected 35")
+
+    for file in sorted(glob.glob("probe/*.smart.txt")):
+        device = file.split("/")[-1].split(".")[0]
+        with open(file) as f:
+            text = f.read()
+        jsonText = _smartTextToJSON(text)
+
+        if not _check(sysInfo._parseSmartText(text) == sysInfo._parseSmartJSON(jsonText),
+                      f"{device} text {sysInfo._parseSmartText(text)} json {sysInfo._parseSmartJSON(jsonText)}"):
+            continue
+
+        splitTime = _timeit(_parseSmartSplitAll, text, loops)
+        textTime  = _timeit(sysInfo._parseSmartText, text, loops)
+        jsonTime  = _timeit(sysInfo._parseSmartJSON, jsonText, loops)
+        print(f"  {device}  split all {splitTime*1e6:7.1f} us   text {textTime*1e6:7.1f} us   json {jsonTime*1e6:7.1f} us")
+
+
+def _fakeSysfs(root):
+    # Two disks on ata1/ata2 (sda has an unmounted partition), a raid array, a loop device and
+    # the SD card partition mounted as /
+    devices = {'sda'      : (1953525168, "ata1"),
+               'sdb'      : (1953525168, "ata2"),
+               'md0'      : (7813771264, None),
+               'loop0'    : (1024, None),
+               'mmcblk1'  : (122142720, None)}
+    partitions = {'sda1': 'sda', 'mmcblk1p1': 'mmcblk1'}
+    for name, (blocks, ata) in devices.items():
+        os.makedirs(f"{root}/block/{name}")
+        with open(f"{root}/block/{name}/size", "w") as f:
+            f.write(f"{blocks}\n")
+        if ata is not None:
+            target = f"{root}/devices/platform/f8000000.pcie/{ata}/host0/target0:0:0/0:0:0:0"
+            os.makedirs(target)
+            os.symlink(target, f"{root}/block/{name}/device")
+    for name, parent in partitions.items():
+        os.makedirs(f"{root}/block/{parent}/{name}")
+        open(f"{root}/block/{parent}/{name}/partition", "w").close()
+        with open(f"{root}/block/{parent}/{name}/size", "w") as f:
+            f.write("122140672\n")
+
+    with open(f"{root}/mountinfo", "w") as f:
+        f.write("22 1 179:1 / / rw,noatime shared:1 - ext4 /dev/mmcblk1p1 rw\n")
+        f.write("36 22 9:0 / /mnt/md0 rw,relatime shared:2 - ext4 /dev/md0 rw,stripe=512\n")
+        f.write("37 22 9:0 /share /srv/share rw,relatime shared:2 - ext4 /dev/md0 rw,stripe=512\n")
+        f.write("25 22 0:22 / /sys rw,nosuid shared:7 - sysfs sysfs rw\n")
+
+
+def benchSysfs(loops = 200):
+    """
+    Check the device inventory and the ATA mapping read from a fake sysfs tree and mount table,
+    and time getDevices against it.
+    """
+    savedRoot, savedMountinfo = sysInfo.SYSFS_ROOT, sysInfo.MOUNTINFO
+    with tempfile.TemporaryDirectory() as root:
+        _fakeSysfs(root)
+        sysInfo.SYSFS_ROOT = root
+        sysInfo.MOUNTINFO  = f"{root}/mountinfo"
+        try:
+            print("Devices from sysfs")
+            devices, sizes = sysInfo.getDevices()
+            _check(devices == {'hd': ['sda', 'sdb'], 'mnt': ['md0', 'mmcblk1p1']}, f"devices {devices}")
+            _check(sizes == {'sda': "1.0TB", 'sdb': "1.0TB", 'md0': "4.0TB", 'mmcblk1p1': "62.5GB"},
+                   f"sizes {sizes}")
+            mapping = sysInfo.getDevicesMapping(devices['hd'])
+            _check(mapping == {'sda': "ata1", 'sdb': "ata2"}, f"mapping {mapping}")
+            _check(sysInfo._getMountPoints().get('md0') == "/mnt/md0",
+                   f"md0 mounted on {sysInfo._getMountPoints().get('md0')}")
+
+            devicesTime = _timeit(lambda arg: sysInfo.getDevices(), None, loops)
+            print(f"  getDevices {devicesTime*1e6:8.1f} us")
+        finally:
+            sysInfo.SYSFS_ROOT, sysInfo.MOUNTINFO = savedRoot, savedMountinfo
+
+
+def _benchImages():
+    # Every background with some text, plus random noise
+    from PIL import Image, ImageDraw
+    import random
+
+    images = []
+    for file in sorted(glob.glob("oled/*.png")):
+        image = Image.open(file).convert("1")
+        ImageDraw.Draw(image).text((54, 20), "42% 12.3MB", fill = 1)
+        images.append(image)
+
+    noise = Image.new("1", (NASrender.OLED_WD, NASrender.OLED_HT))
+    noise.putdata([random.choice([0, 255]) for i in range(NASrender.OLED_WD*NASrender.OLED_HT)])
+    images.append(noise)
+    return images
+
+
+def benchPages(loops = 200):
+    """
+    Time the PIL to SH1106 pages conversion, pure python (the luma loop) against numpy.  Both
+    must produce the same bytes.
+    """
+    if NASrender.numpy is None:
+        print("SH1106 pages conversion : numpy not installed")
+        return
+
+    images = _benchImages()
+    for image in images:
+        if not _check(NASrender.imageToPagesPython(image) == NASrender.imageToPagesNumpy(image),
+                      "SH1106 pages conversion : numpy bytes differ from the python ones"):
+            return
+
+    pythonTime = sum(_timeit(NASrender.imageToPagesPython, image, loops) for image in images) / len(images)
+    numpyTime  = sum(_timeit(NASrender.imageToPagesNumpy, image, loops) for image in images) / len(images)
+    print("SH1106 pages conversion per frame (byte exact)")
+    print(f"  python {pythonTime*1e6:8.1f} us   numpy {numpyTime*1e6:8.1f} us   x{pythonTime/numpyTime:.0f}")
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values)-1, int(len(values)*percent/100))]
+
+
+def _gitRevision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output = True,
+                              text = True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def _screensSnapshot(NASscreens):
+    # Same base values as display_loop, read from the probe/ fixtures
+    from queue import Queue
+
+    devices, sizes = sysInfo.getDevices()
+    names, smartAttrs, sumup = sysInfo.getDevicesSmartsAttr(devices['hd'])
+    snapshot = NASscreens.Snapshot()
+    snapshot.update({'devices'    : devices,
+                     'sizes'      : sizes,
+                     'smartAttrs' : smartAttrs,
+                     'sumup'      : sumup,
+                     'raidInfo'   : sysInfo.getRAID(),
+                     'fanSpeed'   : 40,
+                     'temperature': "C",
+                     'ledq'       : Queue()})
+    return snapshot
+
+
+def benchScreens(loops = 200, file = None):
+    """
+    Collect, render and flush every screen in turn, as display_loop rotates them, against the
+    probe/ fixtures and the OLED backend of NAS_OLED (headless by default).  Report by screen the
+    p50/p99 latency with the render cache emptied before each frame, the p50 of a frame taken
+    from the render cache, the memory allocated (tracemalloc peak and retained) and the bytes the
+    frame would send over I2C, with the render cache hits.  Results are saved as JSON (NAS_BENCH_JSON, bench_screens.json in the
+    temporary directory by default, out of the source tree) and compared with the previous run
+    found in the file.
+    """
+    import NASscreens
+
+    if file is None:
+        file = os.environ.get("NAS_BENCH_JSON", os.path.join(tempfile.gettempdir(), "bench_screens.json"))
+
+    # getCPUusage returns the sampler value instead of blocking for a second
+    sysInfo.startCPUSampler()
+    while sysInfo.cpuSample is None:
+        time.sleep(0.1)
+
+    snapshot = _screensSnapshot(NASscreens)
+    ledq = snapshot.values['ledq']
+    screens = [name for name in NASscreens.SCREENS if name != "disc"]
+
+    def frame(name, cached = False):
+        # Every value is collected again, as for a screen shown after its refresh.  Unless cached
+        # the frame is drawn, not copied from the render cache
+        snapshot.expire()
+        if not cached:
+            NASscreens.renderCache.clear()
+            NASscreens.screenInvalidate()
+        NASscreens.drawScreen(name, snapshot)
+        NASscreens.oled_flushimage()
+        NASscreens.oled_reset()
+        return NASscreens.oled_getstats()['lastbytes']
+
+    # Warm up : fonts, backgrounds and caches
+    for name in screens:
+        frame(name)
+
+    times  = {name: [] for name in screens}
+    cached = {name: [] for name in screens}
+    sent   = {name: [] for name in screens}
+    for i in range(loops):
+        for name in screens:
+            start = time.perf_counter()
+            sent[name].append(frame(name))
+            times[name].append(time.perf_counter() - start)
+        while not ledq.empty():
+            ledq.get()
+
+    # Every frame is in the render cache after the first rotation
+    for i in range(loops+1):
+        for name in screens:
+            start = time.perf_counter()
+            frame(name, True)
+            if i > 0:
+                cached[name].append(time.perf_counter() - start)
+        while not ledq.empty():
+            ledq.get()
+
+    allocs = {}
+    tracemalloc.start()
+    for name in screens:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        frame(name)
+        current, peak = tracemalloc.get_traced_memory()
+        allocs[name] = (peak - base, current - base)
+    tracemalloc.stop()
+
+    results = {'revision': _gitRevision(),
+               'backend' : NASscreens.OLED_BACKEND,
+               'loops'   : loops,
+               'screens' : {}}
+    for name in screens:
+        results['screens'][name] = {'p50_us'        : round(_percentile(times[name], 50)*1e6, 1),
+                                    'p99_us'        : round(_percentile(times[name], 99)*1e6, 1),
+                                    'cached_p50_us' : round(_percentile(cached[name], 50)*1e6, 1),
+                                    'alloc_peak'    : allocs[name][0],
+                                    'alloc_retained': allocs[name][1],
+                                    'i2c_bytes'     : round(sum(sent[name])/len(sent[name])),
+                                    'cache'         : NASscreens.renderStats[name]}
+
+    previous = {}
+    if os.path.exists(file):
+        with open(file) as f:
+            previous = json.load(f).get('screens', {})
+
+    print(f"Screens collect + render + flush, {loops} rotations, backend {results['backend']}")
+    print(f"  {'screen':10} {'p50 us':>9} {'p99 us':>9} {'cached':>9} {'alloc':>8} {'kept':>6} {'i2c B':>6} {'hits':>6} {'misses':>6}")
+    for name, result in results['screens'].items():
+        line = f"  {name:10} {result['p50_us']:9.1f} {result['p99_us']:9.1f} {result['cached_p50_us']:9.1f} {result['alloc_peak']:8} {result['alloc_retained']:6} {result['i2c_bytes']:6}"
+        line += f" {result['cache']['hits']:6} {result['cache']['misses']:6}"
+        if name in previous and previous[name]['p50_us'] > 0:
+            line += f"   p50 x{result['p50_us']/previous[name]['p50_us']:.2f}"
+        print(line)
+
+    with open(file, "w") as f:
+        json.dump(results, f, indent = 2)
+    print(f"  saved to {file}")
+
+
+def _fanSpeedWalk(tempval, configlist):
+    # Former lookup : every key of the config section converted and compared, the last match wins
+    retval = 0
+    for k in configlist.keys():
+        if tempval >= float(k):
+            retval = int(configlist[k])
+    return retval
+
+
+def benchFanCurve(loops = 100000):
+    """
+    Check the compiled fan curves (step mode gives the former lookup, linear mode stays between
+    the steps around it, invalid curves are rejected) and time a lookup.
+    """
+    section = {'40.0':'25', '44.0':'30', '46.0':'35', '48.0':'40', '50.0':'50',
+               '52.0':'55', '54.0':'60', '60.0':'100'}
+    step   = NASfan.FanCurve(section.items(), "step")
+    linear = NASfan.FanCurve(section.items(), "linear")
+
+    print("Fan curve")
+    checked = len(failures)
+    for i in range(200, 800):
+        temp = i/10
+        _check(step.speed(temp) == _fanSpeedWalk(temp, section),
+               f"step {temp} : {step.speed(temp)} expected {_fanSpeedWalk(temp, section)}")
+        following = [t for t in step.temps if t > temp]
+        low  = step.speed(temp)
+        high = step.speed(following[0]) if len(following) > 0 and temp >= step.temps[0] else low
+        _check(low <= linear.speed(temp) <= high, f"linear {temp} : {linear.speed(temp)} not in {low}-{high}")
+    _check(linear.speed(49) == 45 and linear.speed(70) == 100 and linear.speed(39.9) == 0,
+           f"linear points : {linear.speed(49)} {linear.speed(70)} {linear.speed(39.9)}")
+
+    for points, mode in [([(50, 30), (45, 40)], "step"),
+                         ([(45, 30), (45, 40)], "step"),
+                         ([(45, 40), (50, 30)], "step"),
+                         ([(45, 140)], "step"),
+                         ([("hot", 40)], "step"),
+                         ([(45, 40)], "smooth")]:
+        try:
+            NASfan.FanCurve(points, mode)
+            _check(False, f"accepted {points} {mode}")
+        except ValueError:
+            pass
+
+    if len(failures) == checked:
+        print("  step lookup matches the former lookup, linear within its steps, invalid curves rejected")
+
+    walkTime   = _timeit(lambda temp: _fanSpeedWalk(temp, section), 47.5, loops)
+    stepTime   = _timeit(step.speed, 47.5, loops)
+    linearTime = _timeit(linear.speed, 47.5, loops)
+    print(f"  former {walkTime*1e6:6.2f} us   step {stepTime*1e6:6.2f} us   linear {linearTime*1e6:6.2f} us")
+
+
+def _thermalPlant(control, duration = 4*3600, period = 5):
+    """
+    Simulate the CPU zone, 1 second steps : heat capacity 60 J/K, conduction to a 25C ambient
+    growing with the fan speed, idle / load / RAID resync power phases.  control(temp, now)
+    returns the fan speed, it is called every period seconds.  Return the (temperature, speed)
+    of every second.
+    """
+    def power(now):
+        phase = now % 3600
+        if phase < 600:
+            return 5.0          # Idle
+        if phase < 2400:
+            return 12.0         # Steady load
+        return 20.0             # Resync
+
+    temp  = 40.0
+    speed = 0
+    trace = []
+    for now in range(duration):
+        if now % period == 0:
+            speed = control(round(temp, 1), now)
+        cooling = (0.15 + 0.6*speed/100)*(temp - 25.0)
+        temp += (power(now) - cooling)/60.0
+        trace.append((temp, speed))
+    return trace
+
+
+def benchFanControl():
+    """
+    Run the default CPU fan curve (step and linear, with the 30s hold of decreases) and the PID
+    mode (default settings, and a target 1C lower) against the same thermal plant.  Less speed
+    changes (5% or more) and direction reversals mean less hunting, the average speed is the fan
+    duty.  The default PID must run at a lower duty with less changes than the step curve.
+    """
+    defaults = configparser.ConfigParser()
+    NASconfig.setDefaults(defaults)
+    section = defaults['CPUFan']
+    pidConfig = NASfan.parseFanPID(defaults['FanControl'])
+
+    def curveControl(mode):
+        curve = NASfan.FanCurve(section.items(), mode)
+        controller = NASfan.FanController()
+        def control(temp, now):
+            controller.update(curve.speed(temp), now)
+            return controller.speed
+        return control
+
+    def pidControl(pidConfig):
+        pid = NASfan.FanPID(pidConfig)
+        controller = NASfan.FanController()
+        def control(temp, now):
+            controller.update(pid.update(temp - pidConfig.cpuTarget, now), now, True)
+            return controller.speed
+        return control
+
+    print("Fan control against the thermal plant model (4h, idle / load / resync)")
+    print(f"  {'mode':12} {'duty %':>7} {'changes':>8} {'reversals':>10} {'mean C':>7} {'max C':>6}")
+    controls = [("step",       curveControl("step")),
+                ("linear",     curveControl("linear")),
+                ("pid",        pidControl(pidConfig)),
+                ("pid 59",     pidControl(pidConfig._replace(cpuTarget = 59)))]
+    results = {}
+    for name, control in controls:
+        trace = _thermalPlant(control)
+        speeds = [speed for temp, speed in trace]
+        temps  = [temp for temp, speed in trace]
+        changes = [b - a for a, b in zip(speeds, speeds[1:]) if abs(b - a) >= 5]
+        reversals = sum(1 for a, b in zip(changes, changes[1:]) if (a > 0) != (b > 0))
+        results[name] = (sum(speeds)/len(speeds), len(changes))
+        print(f"  {name:12} {sum(speeds)/len(speeds):7.1f} {len(changes):8} {reversals:10} {sum(temps)/len(temps):7.1f} {max(temps):6.1f}")
+
+    _check(results['pid'][0] < results['step'][0],
+           f"pid duty {results['pid'][0]:.1f}% not lower than step {results['step'][0]:.1f}%")
+    _check(results['pid'][1] < results['step'][1],
+           f"pid {results['pid'][1]} speed changes not less than step {results['step'][1]}")
+
+
+BENCHES = {'smart'   : benchSmartParse,
+           'sysfs'   : benchSysfs,
+           'pages'   : benchPages,
+           'screens' : benchScreens,
+           'fan'     : benchFanCurve,
+           'fancontrol' : benchFanControl}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] if len(sys.argv) > 1 else list(BENCHES.keys())
+    for name in names:
+        BENCHES[name]()
+    if failures:
+        print(f"{len(failures)} check(s) FAILED")
+        sys.exit(1)
@@ -2,10 +2,16 @@
 # Configuration processing code
 #
 import os
+import time
 import configparser
+from typing import NamedTuple
 from NASlog import *
+from NASfan import *
 CONFIG_FILE='NAS.conf'
 
+# Seconds between two checks of the configuration file modification time
+CONFIG_CHECK = 5
+
 #
 def setOLEDDefaults(config):
     """
@@ -39,31 +45,67 @@ def setGeneralDefaults(config):
         config['General']['debug'] = 'N'
 
 #
-def loadConfigAndDefaults():
+def setSMARTDefaults(config):
     """
-    Load up the configuration file.  We utilize a single config file, and for everything that is
-    missing we setup default values for it.  This allows for one stop shopping for setting up the
-    configuration file, and if we need to we could actually write out the config if the file does 
-    not exist.
+    Setup the defaults for the SMART section of the configuration file.
     """
-    
-    try:
-        config = configparser.ConfigParser()
-        config.read( CONFIG_FILE )
-    except Exception as e:
-        logError( f"Error processing configuration file {CONFIG_FILE} exception is {e}")
+    if not 'SMART' in config.keys():
+        config['SMART'] = {}
 
-    #
-    # Setup defaults for anything that is missing
-    #
+    if not 'ttl' in config['SMART'].keys():
+        config['SMART']['ttl'] = '3600'
+
+#
+def setFanControlDefaults(config):
+    """
+    Setup the defaults for the FanControl section : the control mode of each zone (step or linear
+    fan curve, or pid) and the PID settings.
+    """
+    if not 'FanControl' in config.keys():
+        config['FanControl'] = {}
+
+    if not 'cpu' in config['FanControl'].keys():
+        config['FanControl']['cpu'] = 'step'
+    if not 'hdd' in config['FanControl'].keys():
+        config['FanControl']['hdd'] = 'step'
+
+    pid = {'cpu_target':'60', 'hdd_target':'45', 'kp':'5', 'ki':'0.01', 'kd':'10', 'min':'0', 'max':'100'}
+    for key in pid:
+        if not key in config['FanControl'].keys():
+            config['FanControl'][key] = pid[key]
+
+#
+def setDefaults(config):
+    """
+    Setup the defaults of every section.
+    """
     setGeneralDefaults( config )
     setOLEDDefaults( config )
+    setSMARTDefaults( config )
+    setFanControlDefaults( config )
     if not 'CPUFan' in config.keys():
         config['CPUFan'] = {'55.0':'30', '60.0':'55', '65.0':'100'}
     if not 'HDDFan' in config.keys():
         config['HDDFan'] = {'40.0':'25', '44.0':'30', '46.0':'35',
                             '48.0':'40', '50.0':'45', '50.0':'50',
                             '52.0':'55', '54.0':'60', '60.0':'100'}
+
+#
+def loadConfigAndDefaults():
+    """
+    Load up the configuration file.  We utilize a single config file, and for everything that is
+    missing we setup default values for it.  This allows for one stop shopping for setting up the
+    configuration file, and if we need to we could actually write out the config if the file does 
+    not exist.  configparser.Error is raised when the file does not parse.
+    """
+    
+    config = configparser.ConfigParser()
+    config.read( CONFIG_FILE )
+
+    #
+    # Setup defaults for anything that is missing
+    #
+    setDefaults( config )
  
     if not os.path.exists( CONFIG_FILE ):
         with open( CONFIG_FILE, 'w' ) as configfile:
@@ -71,38 +113,150 @@ def loadConfigAndDefaults():
 
     return config
 
+class OLEDConfig(NamedTuple):
+    screenduration : int
+    screensaver    : int
+    screenlist     : tuple
+    enabled        : bool
+
+class NASConfig(NamedTuple):
+    temperature : str
+    debug       : bool
+    oled        : OLEDConfig
+    smartTTL    : int
+    cpuFan      : FanCurve
+    hddFan      : FanCurve
+    cpuMode     : str       # step, linear or pid
+    hddMode     : str
+    fanPID      : FanPIDConfig
+
+#
+def _fanMode(mode):
+    if mode not in FAN_CONTROL_MODES:
+        raise ValueError(f"fan control mode {mode} is not one of {FAN_CONTROL_MODES}")
+    return mode
+
+#
+def parseConfig(config, fallback = None):
+    """
+    Convert the configuration (with its defaults) to a NASConfig.  Raise ValueError when a value
+    does not convert or a fan curve is invalid.  With a fallback NASConfig the invalid values
+    are reported and taken from the fallback instead, the valid ones are kept.
+    """
+    def value(field, parse):
+        try:
+            return parse()
+        except (ValueError, KeyError, TypeError) as e:
+            if fallback is None:
+                raise
+            logError( f"Error processing {field} of configuration file {CONFIG_FILE} exception is {e}")
+            return getattr(fallback, field)
+
+    oled = config['OLED']
+    cpuMode = value('cpuMode', lambda: _fanMode(config['FanControl']['cpu']))
+    hddMode = value('hddMode', lambda: _fanMode(config['FanControl']['hdd']))
+    return NASConfig(temperature = config['General']['temperature'],
+                     debug       = config['General']['debug'] == 'Y',
+                     oled        = value('oled', lambda: OLEDConfig(screenduration = int(oled['screenduration']),
+                                                                    screensaver    = int(oled['screensaver']),
+                                                                    screenlist     = tuple(oled['screenlist'].replace("\"","").split()),
+                                                                    enabled        = oled['enabled'] != 'N')),
+                     smartTTL    = value('smartTTL', lambda: int(config['SMART']['ttl'])),
+                     cpuFan      = value('cpuFan', lambda: FanCurve(config['CPUFan'].items(), "step" if cpuMode == "pid" else cpuMode)),
+                     hddFan      = value('hddFan', lambda: FanCurve(config['HDDFan'].items(), "step" if hddMode == "pid" else hddMode)),
+                     cpuMode     = cpuMode,
+                     hddMode     = hddMode,
+                     fanPID      = value('fanPID', lambda: parseFanPID(config['FanControl'])))
+
+#
+def _defaultConfig():
+    defaults = configparser.ConfigParser()
+    setDefaults( defaults )
+    return parseConfig( defaults )
+
+# Configuration in use, replaced as a whole when the file changes so readers never see a partial one
+_config      = None
+_configMtime = None
+_configCheck = 0
+
+#
+def getConfig():
+    """
+    Return the configuration.  The file is parsed once, then again only when its modification
+    time changes, checked at most every CONFIG_CHECK seconds.  A file that does not parse is
+    reported and the configuration in use is kept, an invalid value (fan curve point, PID gain...)
+    is reported and the value in use (or its default) is kept with the rest of the file.
+    """
+    global _config, _configMtime, _configCheck
+
+    now = time.monotonic()
+    if _config is not None and now - _configCheck < CONFIG_CHECK:
+        return _config
+    _configCheck = now
+
+    try:
+        mtime = os.stat( CONFIG_FILE ).st_mtime_ns
+    except OSError:
+        mtime = None
+    if _config is not None and mtime == _configMtime:
+        return _config
+
+    fallback = _config if _config is not None else _defaultConfig()
+    try:
+        config = parseConfig( loadConfigAndDefaults(), fallback )
+    except (configparser.Error, OSError, UnicodeError, ValueError, KeyError, TypeError) as e:
+        logError( f"Error processing configuration file {CONFIG_FILE} exception is {e}")
+        _config      = fallback
+        _configMtime = mtime
+        return _config
+
+    _config      = config
+    _configMtime = mtime
+    return _config
+
 #
 def loadCPUFanConfig():
     """
-    Load the main configuration and return just the CPUFan portion.  Instead of loading once, and
-    then pulling the CPU configuration out, we load everytime there is a call, this allos us to read
-    in a new file if here is a change.
+    Return the CPU FanCurve.  The configuration is read again when the file changes.
     """
-    return loadConfigAndDefaults()['CPUFan']
+    return getConfig().cpuFan
 
 #
 def loadHDDFanConfig():
     """
-    Load the main configuration and reutrn just the HDDFan portion.  Instead of loading once, and
-    then pulling the HDD configuraiton out, we can load everytime there is a call.  This will allow us
-    to read in changes if they user does so.
+    Return the HDD FanCurve.  The configuration is read again when the file changes.
     """
-    return loadConfigAndDefaults()['HDDFan']
+    return getConfig().hddFan
+
+#
+def loadFanControlConfig():
+    """
+    Return the control mode of the zones and the PID settings : (cpuMode, hddMode, FanPIDConfig)
+    """
+    config = getConfig()
+    return (config.cpuMode, config.hddMode, config.fanPID)
 
 #
 def loadOLEDConfig():
     """
     Obtain the OLED configuration info, and return it.
     """
-    config = loadConfigAndDefaults()['OLED']
-    return config;
+    return getConfig().oled
+
+#
+def loadSMARTTTL():
+    """
+    Return how long (in seconds) the SMART values read from a drive are reused before the drive
+    is queried again.
+    """
+    return getConfig().smartTTL
 
 #
 def loadTempConfig():
     """
     Return the value we are supposed to be using for temperature, either Celcius, or Fahrenheit.
     """
-    return loadConfigAndDefaults()['General']['temperature']
+    return getConfig().temperature
 
 #
 def loadDebugMode():
@@ -110,6 +264,4 @@ def loadDebugMode():
     Return the value of the debugging setting.  'Y' is used to enable debug, Anything else is
     no debugging
     """
-    if loadConfigAndDefaults()['General']['debug'] == 'Y':
-        return True
-    return False
+    return getConfig().debug
@@ -0,0 +1,203 @@
+#!/usr/bin/python3
+
+#
+# Fan control : fan curves compiled from the [CPUFan]/[HDDFan] sections of NAS.conf, the
+# optional PID mode of [FanControl] and the speed state machine
+#
+
+from bisect import bisect_right
+from typing import NamedTuple
+
+
+FAN_MODES = ("step", "linear")
+# Control mode of a zone (cpu, hdd) : its fan curve or the PID
+FAN_CONTROL_MODES = FAN_MODES + ("pid",)
+
+class FanCurve:
+    """
+    Fan curve compiled from (temperature, speed) points.  The temperatures must be strictly
+    increasing and the speeds in 0-100 and not decreasing, an invalid curve raises ValueError.
+    Below the first point the fan is off.  In step mode the speed is the one of the last point
+    reached, in linear mode it is interpolated between the two points around the temperature.
+    """
+    def __init__(self, points, mode = "step"):
+        if mode not in FAN_MODES:
+            raise ValueError(f"fan curve mode {mode} is not one of {FAN_MODES}")
+
+        temps  = []
+        speeds = []
+        for temp, speed in points:
+            temp  = float(temp)
+            speed = int(speed)
+            if speed < 0 or speed > 100:
+                raise ValueError(f"fan speed {speed} at {temp} is not in 0-100")
+            if len(temps) > 0 and temp <= temps[-1]:
+                raise ValueError(f"fan curve temperature {temp} follows {temps[-1]}, temperatures must increase")
+            if len(speeds) > 0 and speed < speeds[-1]:
+                raise ValueError(f"fan speed {speed} at {temp} is lower than {speeds[-1]} at {temps[-1]}")
+            temps.append(temp)
+            speeds.append(speed)
+
+        self.mode   = mode
+        self.temps  = tuple(temps)
+        self.speeds = tuple(speeds)
+
+    def __repr__(self):
+        return f"FanCurve({list(zip(self.temps, self.speeds))}, {self.mode})"
+
+    def speed(self, temp):
+        i = bisect_right(self.temps, temp)
+        if i == 0:
+            return 0
+        if self.mode == "step" or i == len(self.temps):
+            return self.speeds[i-1]
+
+        t0, t1 = self.temps[i-1], self.temps[i]
+        s0, s1 = self.speeds[i-1], self.speeds[i]
+        return int(round(s0 + (s1-s0)*(temp-t0)/(t1-t0)))
+
+
+class FanPIDConfig(NamedTuple):
+    cpuTarget : float       # Temperatures the PID holds the zones at
+    hddTarget : float
+    kp        : float       # Speed % by degree over the target
+    ki        : float       # Speed % by degree and second
+    kd        : float       # Speed % by degree/second of temperature slope
+    minSpeed  : int         # Speed range of the PID
+    maxSpeed  : int
+
+def parseFanPID(section):
+    """
+    Return the FanPIDConfig of the [FanControl] section, raise ValueError when it is invalid.
+    """
+    config = FanPIDConfig(cpuTarget = float(section['cpu_target']),
+                          hddTarget = float(section['hdd_target']),
+                          kp        = float(section['kp']),
+                          ki        = float(section['ki']),
+                          kd        = float(section['kd']),
+                          minSpeed  = int(section['min']),
+                          maxSpeed  = int(section['max']))
+    if config.kp < 0 or config.ki < 0 or config.kd < 0:
+        raise ValueError(f"fan PID gains must not be negative {config}")
+    if not 0 <= config.minSpeed <= config.maxSpeed <= 100:
+        raise ValueError(f"fan PID speeds must be 0 <= min <= max <= 100 {config}")
+    return config
+
+
+class FanPID:
+    """
+    PID on the temperature error (temperature - target, the highest of the zones).  The
+    derivative is the slope of the error, it speeds the fan up as soon as a fast rise starts.
+    Anti-windup : the integral stays within the speed range and does not grow while the output
+    is saturated in the same direction.  The speed is kept within min/max.
+    """
+    def __init__(self, config):
+        self.config   = config
+        self.integral = None
+        self.error    = None
+        self.time     = None
+        self.slope    = 0.0
+
+    def update(self, error, now):
+        config = self.config
+        if self.time is None or now <= self.time:
+            dt = 0
+        else:
+            dt = now - self.time
+            # Sensors are noisy, the slope is smoothed over a few samples
+            self.slope = 0.5*self.slope + 0.5*(error - self.error)/dt
+        if self.integral is None:
+            self.integral = float(config.minSpeed)
+        self.error = error
+        self.time  = now
+
+        proportional = config.kp*error + config.kd*self.slope
+        output = proportional + self.integral
+
+        saturatedHigh = output >= config.maxSpeed and error > 0
+        saturatedLow  = output <= config.minSpeed and error < 0
+        if not saturatedHigh and not saturatedLow:
+            self.integral += config.ki*error*dt
+            self.integral = max(config.minSpeed, min(config.maxSpeed, self.integral))
+            output = proportional + self.integral
+
+        return int(round(max(config.minSpeed, min(config.maxSpeed, output))))
+
+
+# Seconds between two temperature samples of the fan thread
+FAN_PERIOD = 5
+# Seconds the target speed must stay lower before the fan slows down
+FAN_HOLD = 30
+# A stopped fan is started at FAN_KICK_SPEED for FAN_KICK seconds, older units do not start slower
+FAN_KICK = 2
+FAN_KICK_SPEED = 50
+
+class FanController:
+    """
+    Fan speed state machine, it never blocks.  An increase is applied at once.  A decrease is
+    pending until the target stayed lower for the hold time, a higher target cancels it.  A
+    stopped fan is kicked at kickSpeed before the target is applied.  update() and force() return
+    the speed to write to the fan, None when it does not change.
+    """
+    def __init__(self, hold = FAN_HOLD, kick = FAN_KICK, kickSpeed = FAN_KICK_SPEED):
+        self.hold      = hold
+        self.kick      = kick
+        self.kickSpeed = kickSpeed
+
+        self.speed     = 0        # Speed on the fan
+        self.target    = 0        # Latest target
+        self.pending   = None     # Deadline of the pending decrease
+        self.kickEnd   = None     # End of the spin-up kick
+
+    def force(self, speed):
+        self.pending = None
+        self.kickEnd = None
+        self.target  = speed
+        self.speed   = speed
+        return speed
+
+    def update(self, target, now, instantaneous = False):
+        self.target = target
+
+        if self.kickEnd is not None:
+            if now < self.kickEnd and 0 < target <= self.kickSpeed:
+                return None
+            # Kick over, or no longer needed
+            self.kickEnd = None
+            return self._apply(target)
+
+        if target >= self.speed:
+            self.pending = None
+            if target == self.speed:
+                return None
+            if self.speed == 0 and target < self.kickSpeed:
+                self.kickEnd = now + self.kick
+                return self._apply(self.kickSpeed)
+            return self._apply(target)
+
+        if instantaneous:
+            self.pending = None
+            return self._apply(target)
+
+        if self.pending is None:
+            self.pending = now + self.hold
+        if now < self.pending:
+            return None
+        self.pending = None
+        return self._apply(target)
+
+    def _apply(self, speed):
+        if speed == self.speed:
+            return None
+        self.speed = speed
+        return speed
+
+    def wait(self, now, period = FAN_PERIOD):
+        """
+        Return how long to wait before the next update : the sampling period, shorter when the
+        kick ends or the pending decrease is due before.
+        """
+        deadlines = [deadline for deadline in (self.kickEnd, self.pending) if deadline is not None]
+        if len(deadlines) == 0:
+            return period
+        return max(0, min(period, min(deadlines) - now))
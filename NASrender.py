@@ -0,0 +1,327 @@
+#!/usr/bin/python3
+
+#
+# Device independent rendering for the OLED backends : the framebuffer, backgrounds, text
+# and the SH1106 page format.  A backend imports everything from here and adds its own
+# oled_flushimage, oled_fill, oled_flushblock, oled_power and oled_getstats
+#
+
+import os
+import functools
+
+from PIL import Image
+from PIL import ImageDraw
+from PIL import ImageFont
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+OLED_WD=128
+OLED_HT=64
+OLED_NUMPAGES = OLED_HT>>3
+
+debug = False
+
+
+class FrameBuffer:
+    """
+    The image the screens are drawn into and its ImageDraw, both kept for the life of the process.
+    The image is cleared in place and handed to the device on flush.
+    """
+    def __init__(self, width = OLED_WD, height = OLED_HT):
+        self.image  = Image.new("1", (width, height))
+        self.draw   = ImageDraw.Draw(self.image)
+
+    def clear(self, value = 0):
+        self.draw.rectangle((0, 0, self.image.width-1, self.image.height-1), outline=value, fill=value)
+
+framebuffer = FrameBuffer()
+
+
+class GlyphAtlas:
+    """
+    The glyphs of one font rasterized once into 1 bit images, with their advance.  Printable
+    ASCII is built upfront, other characters on first use.
+    """
+    def __init__(self, font):
+        self.font   = font
+        ascent, descent = font.getmetrics()
+        self.height = ascent + descent
+        self.glyphs = {}
+        for code in range(32, 127):
+            self.glyph(chr(code))
+
+    def glyph(self, char):
+        if char not in self.glyphs:
+            advance = int(round(self.font.getlength(char)))
+            right = self.font.getbbox(char)[2]
+            image = Image.new("1", (max(advance, right, 1), self.height))
+            ImageDraw.Draw(image).text((0, 0), char, fill=1, font=self.font)
+            self.glyphs[char] = (image, advance)
+        return self.glyphs[char]
+
+    def textwidth(self, text):
+        width = 0
+        for char in text:
+            width += self.glyph(char)[1]
+        return width
+
+    def render(self, text):
+        width = 1
+        x = 0
+        for char in text:
+            image, advance = self.glyph(char)
+            width = max(width, x + image.width)
+            x += advance
+
+        rendered = Image.new("1", (width, self.height))
+        x = 0
+        for char in text:
+            image, advance = self.glyph(char)
+            rendered.paste(255, (x, 0), image)
+            x += advance
+        return rendered
+
+
+def loadFont(file, size):
+    try:
+        return ImageFont.truetype(file, size)
+    except OSError:
+        # Fonts are only deployed on the NAS, fall back to the PIL font elsewhere
+        print(f"-- {file} not found, using default font")
+        return ImageFont.load_default()
+
+fontSmall  = loadFont("fonts/ProggyTiny.ttf", 16)
+fontMedium = loadFont("fonts/FreePixel.ttf", 16)
+fontLarge  = loadFont("fonts/ProggyTiny.ttf", 22)
+
+# One atlas by character width : 6 small, 8 medium, anything else large
+oled_atlases = {6: GlyphAtlas(fontSmall), 8: GlyphAtlas(fontMedium), 10: GlyphAtlas(fontLarge)}
+
+def oled_getatlas(charwd):
+    if charwd in oled_atlases:
+        return oled_atlases[charwd]
+    return oled_atlases[10]
+
+@functools.lru_cache(maxsize = 256)
+def oled_rendertext(textdata, charwd):
+    # Rendered strings are shared, they must not be modified
+    return oled_getatlas(charwd).render(textdata)
+
+
+# Decoded backgrounds by name : (file modification time, 1 bit image)
+oled_backgrounds = {}
+
+def oled_getbg(bgname):
+    """
+    Return the background decoded as a 1 bit image, lit where the PNG is not black.  Backgrounds
+    are decoded on first use and again only when the file modification time changes.
+    """
+    file = "oled/"+bgname+".png"
+    mtime = os.stat(file).st_mtime
+
+    cached = oled_backgrounds.get(bgname)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with Image.open(file) as logo:
+        bg = logo.convert("L").point(lambda value: 255 if value > 0 else 0).convert("1")
+
+    oled_backgrounds[bgname] = (mtime, bg)
+    return bg
+
+
+def imageToPagesPython(image):
+    """
+    Convert a 1 bit image to the SH1106 memory layout : one byte per column and page of 8 rows,
+    the top row being the lowest bit (same conversion as luma sh1106.display).
+    """
+    pixels = image.getdata()
+    pages = []
+    for page in range(OLED_NUMPAGES):
+        buf = bytearray(OLED_WD)
+        offsets = [(page*8+i)*OLED_WD for i in range(8)]
+        for x in range(OLED_WD):
+            buf[x] = \
+                (pixels[x + offsets[0]] and 0x01) | \
+                (pixels[x + offsets[1]] and 0x02) | \
+                (pixels[x + offsets[2]] and 0x04) | \
+                (pixels[x + offsets[3]] and 0x08) | \
+                (pixels[x + offsets[4]] and 0x10) | \
+                (pixels[x + offsets[5]] and 0x20) | \
+                (pixels[x + offsets[6]] and 0x40) | \
+                (pixels[x + offsets[7]] and 0x80)
+        pages.append(buf)
+    return pages
+
+
+def imageToPagesNumpy(image):
+    """
+    Same conversion as imageToPagesPython done by numpy : the pixels are reshaped to
+    pages x rows x columns and the 8 rows of each page packed into one byte, lowest bit on top.
+    """
+    pixels = numpy.asarray(image, dtype = numpy.bool_).reshape(OLED_NUMPAGES, 8, OLED_WD)
+    data = numpy.packbits(pixels, axis = 1, bitorder = 'little').tobytes()
+    return [bytearray(data[page*OLED_WD:(page+1)*OLED_WD]) for page in range(OLED_NUMPAGES)]
+
+
+# numpy is optional, the pure python conversion is used without it
+if numpy is not None:
+    imageToPages = imageToPagesNumpy
+else:
+    imageToPages = imageToPagesPython
+
+
+def diffPages(pages, sentpages, stats, send = None):
+    """
+    Compare pages with the last frame sent (sentpages, updated in place) and call
+    send(page, column, data) with the changed column range of each dirty page.  stats counts
+    the frames, the skipped frames and the bytes sent (3 command bytes per range plus the data).
+    Return the number of bytes of this frame.
+    """
+    sent = 0
+    for page in range(OLED_NUMPAGES):
+        prev = sentpages[page]
+        cur  = pages[page]
+        if cur == prev:
+            continue
+
+        first = 0
+        while cur[first] == prev[first]:
+            first += 1
+        last = OLED_WD-1
+        while cur[last] == prev[last]:
+            last -= 1
+
+        if send is not None:
+            send(page, first, cur[first:last+1])
+        sent += 3 + last+1-first
+
+        sentpages[page] = cur
+
+    stats['lastbytes'] = sent
+    stats['bytes'] += sent
+    if sent > 0:
+        stats['frames'] += 1
+    else:
+        stats['skipped'] += 1
+
+    return sent
+
+
+def oled_getmaxY():
+    return OLED_HT
+
+def oled_getmaxX():
+    return OLED_WD
+
+def oled_loadbg(bgname):
+    if (debug): print(f"-- oled_loadbg ({bgname})")
+    if bgname == "bgblack":
+        oled_clearbuffer()
+        return
+    elif bgname == "bgwhite":
+        oled_clearbuffer(1)
+        return
+    try:
+        framebuffer.image.paste(oled_getbg(bgname))
+
+    except FileNotFoundError:
+        oled_clearbuffer()
+
+
+def oled_clearbuffer(value = 0):
+    if (debug): print(f"-- oled_clearbuffer {value}")
+    framebuffer.clear(value)
+    return
+
+
+def oled_writebyterow(x,y,bytevalue, mode = 0):
+    if (debug): print(f"-- oled_writebyterow {x},{y}, {bytevalue}, {mode}")
+
+    return 
+
+
+def oled_writebuffer(x,y,value, mode = 0):
+    if (debug): print(f"-- oled_writebuffer {x},{y}, {value}, {mode}")
+    return 
+
+
+def oled_drawfilledrectangle(x, y, wd, ht, mode = 0):
+    if (debug): print(f"-- oled_drawfilledrectangle ({x},{y}) - ({wd},{ht}) # {mode}")
+
+    framebuffer.draw.rectangle(xy=[x,y,x+wd,y+ht],outline=mode)
+
+    return
+    
+def oled_drawline(x, y, wd, ht, mode = 0):
+    if (debug): print(f"-- oled_drawline ({x},{y}) - ({wd},{ht}) # {mode}")
+
+    framebuffer.draw.line(xy=[x,y,x+wd,y+ht],fill = 1)
+
+    return
+
+
+
+def oled_textwidth(textdata, charwd = 6):
+    return oled_getatlas(charwd).textwidth(textdata)
+
+def oled_writetextaligned(textdata, x, y, boxwidth, alignmode, charwd = 6, mode = 0):
+    leftoffset = 0
+    if alignmode == 1:
+        # Centered
+        leftoffset = (boxwidth-oled_textwidth(textdata, charwd))>>1
+    elif alignmode == 2:
+        # Right aligned
+        leftoffset = (boxwidth-oled_textwidth(textdata, charwd))
+
+    oled_writetext(textdata, x+leftoffset, y, charwd, mode)
+    
+
+def oled_writetext(textdata, x, y, charwd = 6, mode = 0):
+    if (debug): print(f"-- oled_writetext ({x},{y}) \"{textdata}\", size={charwd}")
+
+    # The rendered string is a mask, only its lit pixels are written
+    framebuffer.image.paste(255, (int(x), int(y)), oled_rendertext(textdata, charwd))
+
+    
+
+def oled_fastwritetext(textdata, x, y, charht, charwd, fontbytes, mode = 0):
+    if (debug): print("-- oled_fastwritetext")
+    return
+
+
+def oled_inverse(enable = True):
+    if (debug): print("- oled_inverse")
+    return
+
+
+def oled_fullwhite(enable = True):
+    if (debug): print("-- oled_fullwhite")
+    return 
+
+
+def oled_sync(timeout = 5):
+    # Frames are flushed synchronously unless the backend has a flush worker
+    return
+
+
+def oled_getframe():
+    """
+    Return a copy of the framebuffer
+    """
+    return framebuffer.image.copy()
+
+def oled_putframe(frame):
+    framebuffer.image.paste(frame)
+
+
+def oled_reset():
+    if (debug): print("-- oled_reset")
+
+    framebuffer.clear()
+
+    return
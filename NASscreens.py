@@ -0,0 +1,508 @@
+#!/usr/bin/python3
+
+#
+# OLED screens shown by display_loop.  A screen is registered with @screen, it declares the
+# snapshot values it draws (needs) and how often they can change (refresh, in seconds).
+# display_loop keeps the base values of the snapshot up to date :
+#   {'devices', 'sizes', 'smartAttrs', 'sumup', 'raidInfo', 'fanSpeed', 'temperature', 'ledq'}
+# the other values are collected when a screen needs them and they are older than its refresh.
+#
+
+import os
+import time
+from collections import OrderedDict
+
+from sysInfo import *
+
+# OLED backend : SH1306 (I2C device), headless (frames rendered in memory) or trace
+OLED_BACKEND = os.environ.get("NAS_OLED", "SH1306" if isArmbian else "headless")
+
+if OLED_BACKEND == "SH1306":
+    from NAS_SH1306 import *
+elif OLED_BACKEND == "headless":
+    from NAS_headless import *
+else:
+    from NAS_trace import *
+
+import datetime
+
+OFF   = 0
+BLINK = 1
+ON    = 2
+
+MAX_WARNING  = 50
+
+weekdaynamelist = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+monthlist = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"]
+oledscreenwidth = oled_getmaxX()
+
+fontwdSml = 6    # Maps to 6x8
+fontwdReg = 8    # Maps to 8x16
+fontwdLrg = 10    # Maps to 8x16
+stdleftoffset = 54
+
+
+# Screens by name, as listed in the OLED screenlist setting
+SCREENS = {}
+
+def screen(name, needs = (), refresh = 60, stateful = False, pages = None):
+    """
+    Register the decorated function as the screen name.  It is called with the needed snapshot
+    values and returns False when there is nothing to show.  A stateful screen keeps values
+    between draws (graph, rates) or has side effects, it is drawn again even when its inputs did
+    not change.  A paged screen gives pages(data), the list of its pages, and draws data['page'].
+    """
+    def register(func):
+        func.name     = name
+        func.needs    = needs
+        func.refresh  = refresh
+        func.stateful = stateful
+        func.pages    = pages
+        func.pending  = []
+        func.page     = None
+        SCREENS[name] = func
+        return func
+    return register
+
+
+def _collectRAID(values):
+    raidInfo = values['raidInfo']
+    if raidInfo and any(raidInfo[md]['recovery'] for md in raidInfo):
+        # Resync progress is not notified, read it while it runs
+        return getRAID()
+    return raidInfo
+
+# Snapshot values read by the screens, from the base values
+COLLECTORS = {'cpu'      : lambda values: getCPUusage(),
+              'usage'    : lambda values: getDeviceUsage(values['devices']['mnt']),
+              'activity' : lambda values: getDeviceActivty(values['devices']['mnt']),
+              'ram'      : lambda values: getRAMusage(),
+              'cputemp'  : lambda values: getCPUtemp(),
+              'ip'       : lambda values: getIPlist(),
+              'raid'     : _collectRAID,
+              'minute'   : lambda values: datetime.datetime.now().replace(second = 0, microsecond = 0)}
+
+
+class Snapshot:
+    """
+    The values shared by the screens.  A collected value is read again only when it is older
+    than the refresh of the screen asking for it.
+    """
+    def __init__(self):
+        self.values = {}
+        self.times  = {}
+
+    def update(self, values):
+        self.values.update(values)
+
+    def expire(self):
+        self.times = {}
+
+    def collect(self, needs, maxAge):
+        now = time.monotonic()
+        for key in needs:
+            if key in COLLECTORS and (key not in self.times or now - self.times[key] >= maxAge):
+                self.values[key] = COLLECTORS[key](self.values)
+                self.times[key]  = now
+        return {key: self.values.get(key) for key in needs}
+
+
+# Frames drawn by screen name and inputs hash, the least recently used is dropped first
+RENDER_CACHE_SIZE = 32
+renderCache = OrderedDict()
+
+# By screen : frames taken from the cache (hits), drawn (misses) and left on display (skipped)
+renderStats = {}
+
+# Screen name and inputs hash of the frame on display
+screenShown = None
+
+def drawScreen(name, snapshot, refresh = False):
+    """
+    Draw the screen name from the snapshot.  Return (needsUpdate, needsFlush) : needsUpdate is
+    False when the screen has nothing to show, needsFlush is False when the frame on display
+    has the same inputs and was not drawn again.  A frame drawn before from the same inputs is
+    copied from the render cache.  A refresh of a paged screen draws its current page again,
+    otherwise the next page is drawn.
+    """
+    global screenShown
+
+    func = SCREENS[name]
+    data = snapshot.collect(func.needs, func.refresh)
+    stats = renderStats.setdefault(name, {'hits':0, 'misses':0, 'skipped':0})
+
+    if func.pages is not None:
+        available = func.pages(data)
+        func.pending = [page for page in func.pending if page in available]
+        if not refresh or func.page not in available:
+            if len(func.pending) == 0:
+                func.pending = list(available)
+            if len(func.pending) == 0:
+                func.page = None
+                screenShown = None
+                return (False, False)
+            func.page = func.pending.pop(0)
+        data['page'] = func.page
+
+    key = (name, hash(repr(data)))
+    if not func.stateful:
+        if key == screenShown:
+            stats['skipped'] += 1
+            return (True, False)
+
+        frame = renderCache.get(key)
+        if frame is not None:
+            renderCache.move_to_end(key)
+            oled_putframe(frame)
+            stats['hits'] += 1
+            screenShown = key
+            return (True, True)
+
+    screenShown = None
+    stats['misses'] += 1
+    if not func(data):
+        return (False, False)
+
+    if not func.stateful:
+        frame = oled_getframe()
+        if frame is not None:
+            renderCache[key] = frame
+            if len(renderCache) > RENDER_CACHE_SIZE:
+                renderCache.popitem(last = False)
+    screenShown = key
+    return (True, True)
+
+def screenInvalidate():
+    """
+    The display shows something else than the last screen drawn
+    """
+    global screenShown
+    screenShown = None
+
+def screenRefresh(name):
+    if name not in SCREENS:
+        return 60
+    return SCREENS[name].refresh
+
+def screenPages(name):
+    """
+    Return the number of pages of the screen not shown yet (raid arrays, ip interfaces)
+    """
+    if name not in SCREENS:
+        return 0
+    return len(SCREENS[name].pending)
+
+def screenRewind(name):
+    """
+    Restart a paged screen at its first page
+    """
+    if name in SCREENS:
+        SCREENS[name].pending = []
+        SCREENS[name].page    = None
+
+
+@screen("cpu", needs = ('cpu',), refresh = 5, stateful = True)
+def screen_cpu(data):
+    # CPU Usage
+    cpuusagelist = data['cpu']
+
+    oled_loadbg("bgcpu")    
+    avg = cpuusagelist['load']
+
+    oled_writetextaligned(f"{avg:02}%", stdleftoffset, 4, oledscreenwidth-stdleftoffset, 1, fontwdReg)
+
+    cpuGraph = screen_cpu.graph
+    if (len(cpuGraph) > 30): del cpuGraph[0]
+    cpuGraph.append(avg)
+
+    for i in range(len(cpuGraph)):
+        oled_drawfilledrectangle(stdleftoffset+4+i*2, 55, 1, -1*int((cpuGraph[i]/4)),2)
+
+    oled_drawline(stdleftoffset+4, 58, 61, 0,1)
+    oled_drawline(stdleftoffset+4, 23, 61, 0,1)
+    return True
+screen_cpu.graph = [0] * 30
+
+
+@screen("storage", needs = ('usage',), refresh = 60)
+def screen_storage(data):
+    # Storage Info           
+    deviceUsage = data['usage']
+    
+    oled_loadbg("bgstorage")
+
+    yoffset = 16
+    for curDev in deviceUsage:
+        # Right column first, safer to overwrite white space
+        oled_writetextaligned(sizestr(deviceUsage[curDev]['total']), 85, yoffset, oledscreenwidth-85, 2, fontwdSml)
+        oled_writetextaligned(str(deviceUsage[curDev]['percent'])+"%", 60, yoffset, 90-60, 2, fontwdSml)
+        tmpname = curDev
+        if len(tmpname) > 8:
+            tmpname = tmpname[0:8]
+        oled_writetext(tmpname, 0, yoffset, fontwdSml)
+
+        yoffset = yoffset + 16
+    return True
+
+
+@screen("bandwidth", needs = ('activity',), refresh = 5, stateful = True)
+def screen_bandwidth(data):
+    # Bandwidth info            
+    deviceActivity = data['activity']
+    stoptime  = time.clock_gettime_ns(time.CLOCK_MONOTONIC)
+    timespan = (stoptime - screen_bandwidth.prevTime)/1000000000
+    screen_bandwidth.prevTime = stoptime    
+
+    oled_clearbuffer()
+    oled_writetextaligned( "BANDWIDTH", 0, 0, oledscreenwidth, 1, fontwdSml)
+    oled_writetextaligned( "Write", 90, 16, oledscreenwidth-90, 2, fontwdSml)
+    oled_writetextaligned( "Read",  60, 16, 90-60,              2, fontwdSml)
+    oled_writetext( "Device", 0, 16, fontwdSml )
+
+    yoffset   = 32
+ 
+    for device in deviceActivity:
+        curr = deviceActivity[device]
+        prev = screen_bandwidth.prev.get(device, curr)
+
+        bandwidth = int(((curr['write']-prev['write']))/(timespan*2))
+        oled_writetextaligned( kbstr(bandwidth,False), 90, yoffset, oledscreenwidth-90, 2, fontwdSml )
+
+        bandwidth = int(((curr['read']-prev['read']))/(timespan*2))
+        oled_writetextaligned( kbstr(bandwidth,False), 60, yoffset, 90-60, 2, fontwdSml )
+
+        oled_writetext( device, 0, yoffset, fontwdSml )
+        yoffset   = yoffset + 16            
+    
+    screen_bandwidth.prev = deviceActivity         
+    return True
+screen_bandwidth.prev     = {}
+screen_bandwidth.prevTime = time.clock_gettime_ns(time.CLOCK_MONOTONIC)
+
+
+@screen("raid", needs = ('raid', 'sizes'), refresh = 10, pages = lambda data: list((data['raid'] or {}).keys()))
+def screen_raid(data):
+    # Raid Info, one page per array
+    raidName = data['page']
+    raid = data['raid'][raidName]
+
+    oled_loadbg("bgraid")
+    oled_writetextaligned(raidName, 0, 0, stdleftoffset, 1, fontwdSml)
+    oled_writetextaligned(raid["type"], 0, 8, stdleftoffset, 1, fontwdSml)
+    if raidName in data['sizes']:
+        oled_writetextaligned(data['sizes'][raidName], 0, 56, stdleftoffset, 1, fontwdSml)
+    else:
+        oled_writetextaligned("----", 0, 56, stdleftoffset, 1, fontwdSml)
+    oled_writetext( raid['status'], stdleftoffset, 4, fontwdReg )
+    if raid['recovery'] != None:
+        oled_writetext(f"{raid['recovery']['percentage']}% at {raid['recovery']['speed']}", stdleftoffset, 16, fontwdSml)
+    oled_writetext(f"Active  : {raid['disc'][0]}", stdleftoffset, 28, fontwdSml)
+    oled_writetext(f"Working : {raid['disc'][1]}", stdleftoffset, 38, fontwdSml)
+    oled_writetext(f"Failed  : {raid['disc'][0]-raid['disc'][1]}", stdleftoffset, 48, fontwdSml)
+    # oled_writetext("Failed  : "+str(int(tmpitem["info"]["failed"]))+"/"+str(int(tmpitem["info"]["devices"])), stdleftoffset, 48, fontwdSml)
+    return True
+
+
+# Stateful : every draw sends the LED state
+@screen("smart", needs = ('smartAttrs', 'sumup', 'ledq'), refresh = 60, stateful = True)
+def screen_smart(data):
+    # Raid Info         
+    sumup      = data['sumup']
+    smartAttrs = data['smartAttrs']
+
+    oled_loadbg("bgdisc")
+    led = {}
+       
+    if    sumup['error']   >  0: 
+        msg = "ERROR"
+    elif  sumup['warning'] >  MAX_WARNING: 
+        msg = "WARNING"
+    else: 
+        msg = "- OK -"  
+
+    yoffset = 0
+    for dev in smartAttrs:
+        oled_writetext(dev, 56, yoffset, fontwdSml)
+        oled_writetextaligned(f"{smartAttrs[dev]['warning']}",75,yoffset,20, 2, fontwdSml)    
+        oled_writetextaligned(f"{smartAttrs[dev]['error']}",90,yoffset,30, 2, fontwdSml)    
+        yoffset += 12
+
+    '''
+    oled_writetextaligned(msg, stdleftoffset, 8, oledscreenwidth-stdleftoffset, 1, fontwdReg)
+
+        
+    
+    if msg == "- OK -":
+       
+        
+        devStb = getDevicesStandby(devices['hd'])
+        idle = 0
+        for stb in devStb:
+            if devStb[stb]: idle += 1
+
+        oled_writetextaligned(f"Idle   {idle}", stdleftoffset, 36, oledscreenwidth-stdleftoffset, 1, fontwdSml)
+        oled_writetextaligned(f"Active {len(devStb)-idle}", stdleftoffset, 48, oledscreenwidth-stdleftoffset, 1, fontwdSml)
+        
+
+    if msg == "WARNING":
+        nb = 0
+        maxWarn = 0
+        readErr = 0
+        seekErr = 0
+        
+        for drive in smartAttrs:
+            led[mapping[drive]] = OFF
+
+            if smartAttrs[drive]['warning'] > MAX_WARNING: 
+                nb += 1    
+                led[mapping[drive]] = BLINK
+     
+            if smartAttrs[drive]['warning'] > maxWarn: maxWarn = smartAttrs[drive]['warning'] 
+            readErr  += smartAttrs[drive]['1']
+            seekErr  += smartAttrs[drive]['7']
+
+        oled_writetextaligned(f"{nb} disc ({maxWarn})", stdleftoffset, 36, oledscreenwidth-stdleftoffset, 1, fontwdSml)
+
+        txt = "???"
+        if (readErr> 0) and (seekErr == 0): txt = "ReadErr"
+        if (readErr==0) and (seekErr == 0): txt = "SeekErr"
+        if (readErr >0) and (seekErr >  0): txt = "Read & Seek"                    
+        oled_writetextaligned(txt, stdleftoffset, 48, oledscreenwidth-stdleftoffset, 1, fontwdSml)
+
+    if msg == "ERROR":                    
+        nb = 0
+        errStr = []
+        for drive in smartAttrs:
+            led[mapping[drive]] = OFF
+            if smartAttrs[drive]['error'] > 0: 
+                nb += 1
+                led[mapping[drive]] = ON
+                
+            errStr.append(str(smartAttrs[drive]['error']))
+        
+        oled_writetextaligned(f"{nb} disc", stdleftoffset, 36, oledscreenwidth-stdleftoffset, 1, fontwdSml)
+        oled_writetextaligned("/".join(errStr), stdleftoffset, 48, oledscreenwidth-stdleftoffset, 1, fontwdSml)
+
+    '''            
+    data['ledq'].put((msg,led))
+    return True
+
+
+@screen("fan", needs = ('fanSpeed',), refresh = 5)
+def screen_fan(data):
+    # FAN 
+    oled_loadbg("bgfan")
+    speed = data['fanSpeed']
+    if speed == 0:
+        oled_writetextaligned(f"OFF", stdleftoffset, 24, oledscreenwidth-stdleftoffset, 1, fontwdReg)    
+    elif speed == 100:
+        oled_writetextaligned(f"MAX", stdleftoffset, 24, oledscreenwidth-stdleftoffset, 1, fontwdReg)    
+    else:
+        oled_writetextaligned(f"Speed", stdleftoffset, 12, oledscreenwidth-stdleftoffset, 1, fontwdReg)
+        oled_writetextaligned(f"{speed}%", stdleftoffset, 32, oledscreenwidth-stdleftoffset, 1, fontwdReg)
+    return True
+
+
+@screen("ram", needs = ('ram',), refresh = 10)
+def screen_ram(data):
+    # RAM 
+    oled_loadbg("bgram")
+    ram = data['ram']
+    oled_writetextaligned(f"{ram['free']}%", stdleftoffset, 8, oledscreenwidth-stdleftoffset, 1, fontwdReg)
+    oled_writetextaligned("of", stdleftoffset, 24, oledscreenwidth-stdleftoffset, 1, fontwdReg)
+    oled_writetextaligned(f"{ram['sizeGB']}GB", stdleftoffset, 40, oledscreenwidth-stdleftoffset, 1, fontwdReg)
+    return True
+
+
+@screen("temp", needs = ('sumup', 'cputemp', 'temperature'), refresh = 10)
+def screen_temp(data):
+    # Temp
+    temperature = data['temperature']
+
+    oled_loadbg("bgtemp")
+    
+    maxcval = data['sumup']['maxTemp']
+    mincval = data['sumup']['minTemp']
+    cpucval = data['cputemp']
+    
+    alltempobj = {"cpu ": cpucval,"hdd":None, " min": mincval, " max": maxcval}
+
+    # Update max C val to CPU Temp if necessary
+    if maxcval < cpucval:
+        maxcval = cpucval
+
+    displayrowht = 8
+    displayrow = 8
+    for curdev in alltempobj:
+        if alltempobj[curdev] != None :
+            if temperature == "C":
+                # Celsius
+                tmpstr = str(alltempobj[curdev])
+                if len(tmpstr) > 4:
+                    tmpstr = tmpstr[0:4]
+            else:
+                # Fahrenheit
+                tmpstr = str(32+9*(alltempobj[curdev])/5)
+                if len(tmpstr) > 5:
+                    tmpstr = tmpstr[0:5]
+
+            oled_writetext(curdev.upper()+": "+ tmpstr+ chr(186) +temperature, stdleftoffset, displayrow, fontwdSml)
+            if (curdev[0] == " "):
+                displayrow = displayrow + displayrowht*1.5
+            else:
+                displayrow = displayrow + displayrowht*2
+        else:
+            oled_writetext(curdev.upper(), stdleftoffset, displayrow, fontwdSml)
+            displayrow = displayrow + displayrowht*1.5
+
+    # Temperature Bar: 40C is min, 80C is max
+    maxht = 21
+    barht = int(maxht*(maxcval-40)/40)
+    if barht > maxht:
+        barht = maxht
+    elif barht < 1:
+        barht = 1
+    oled_drawfilledrectangle(24, 20+(maxht-barht), 3, barht, 2)
+    return True
+
+
+@screen("ip", needs = ('ip',), refresh = 60, pages = lambda data: list(data['ip'].items()))
+def screen_ip(data):
+    # IP Address, one page per interface
+    item = data['page']
+    oled_loadbg("bgip")
+    oled_writetextaligned(item[0], 0, 0, oledscreenwidth, 1, fontwdReg)
+    oled_writetextaligned(item[1], 0,16, oledscreenwidth, 1, fontwdReg)
+    return True
+
+
+@screen("clock", needs = ('minute',), refresh = 1)
+def screen_clock(data):
+    oled_loadbg("bgtime")
+    # Date and Time HH:MM
+    curtime = data['minute']
+    
+    # Month/Day
+    outstr = str(curtime.day).strip()
+    if len(outstr) < 2:
+        outstr = " "+outstr
+    outstr = monthlist[curtime.month-1]+" "+outstr
+    oled_writetextaligned(outstr, stdleftoffset, 8, oledscreenwidth-stdleftoffset, 1, fontwdReg)
+
+    # Day of Week
+    oled_writetextaligned(weekdaynamelist[curtime.weekday()], stdleftoffset, 24, oledscreenwidth-stdleftoffset, 1, fontwdReg)
+
+    # Time
+    outstr = str(curtime.minute).strip()
+    if len(outstr) < 2:
+        outstr = "0"+outstr
+    outstr = str(curtime.hour)+":"+outstr
+    if len(outstr) < 5:
+        outstr = "0"+outstr
+    oled_writetextaligned(outstr, stdleftoffset, 40, oledscreenwidth-stdleftoffset, 1, fontwdReg)
+    return True
+
+
+@screen("disc")
+def screen_disc(data):
+    return True
@@ -1,10 +1,17 @@
 import os
 import time
+import errno
 import socket
 import psutil
 import math
+import shlex
+import json
+import select
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 from pathlib import Path
+from threading import Thread, Lock
 
 isArmbian = False
 
@@ -12,18 +19,32 @@ isArmbian = False
 # docker ps --format '{{ .ID }}\t{{ .Names }}\t{{ .Size}}\t {{ .Status}}'
 # see https://devdojo.com/bobbyiliev/how-to-change-the-docker-ps-output-format
 
-def _readSytem(cmd, file, isProcess):
-    def stringProcess(inString):
-        out = inString.replace('\t', ' ')
-        out = out.strip()
-        while out.find("  ") >= 0:
-            out = out.replace("  ", " ")
-        out = out.split(" ")
-        return out
-    
+def _splitFields(inString):
+    out = inString.replace('\t', ' ')
+    out = out.strip()
+    while out.find("  ") >= 0:
+        out = out.replace("  ", " ")
+    out = out.split(" ")
+    return out
+
+def _splitOutput(out):
+    out = [l for l in out.split("\n") if l]
+
+    output = []
+    for i in out:
+        output.append(_splitFields(i))
+
+    return output
+
+def _readSytemRaw(cmd, file, isProcess, timeout = None):
     try:
         if isArmbian:
-            if isProcess:
+            if isProcess and timeout is not None:
+                # subprocess.TimeoutExpired is left to the caller, the process is killed
+                command = subprocess.run(shlex.split(cmd), stdout = subprocess.PIPE, 
+                                         stderr = subprocess.DEVNULL, text = True, timeout = timeout)
+                out = command.stdout
+            elif isProcess:
                 command = os.popen(cmd)            
                 out = command.read()
                 command.close()
@@ -43,13 +64,100 @@ def _readSytem(cmd, file, isProcess):
 
         return None
 
-    out = [l for l in out.split("\n") if l]
-    
-    output = []
-    for i in out:
-        output.append(stringProcess(i))
+    return out
 
-    return output
+def _readSytem(cmd, file, isProcess, timeout = None):
+    out = _readSytemRaw(cmd, file, isProcess, timeout)
+    if out is None:
+        return None
+
+    return _splitOutput(out)
+
+# Root of sysfs and mount table, can point to a fake tree
+SYSFS_ROOT = "/sys"
+MOUNTINFO  = "/proc/self/mountinfo"
+
+def _useSysfs():
+    # Devices are read from sysfs on Armbian, or from a fake tree on any host
+    return isArmbian or SYSFS_ROOT != "/sys"
+
+def _getBlockDevices():
+    """
+    List (name, size in 512 bytes sectors, isPartition) of the block devices in SYSFS_ROOT/block
+    and of their partitions, sorted by name.
+    """
+    devices = []
+
+    def readSize(path):
+        try:
+            with open(path + "/size", "r") as file:
+                return int(file.read())
+        except (OSError, ValueError):
+            return 0
+
+    try:
+        with os.scandir(f"{SYSFS_ROOT}/block") as entries:
+            for entry in entries:
+                devices.append((entry.name, readSize(entry.path), False))
+                with os.scandir(entry.path) as parts:
+                    for part in parts:
+                        if part.name.startswith(entry.name) and os.path.exists(part.path + "/partition"):
+                            devices.append((part.name, readSize(part.path), True))
+    except OSError:
+        print(f"ERROR reading {SYSFS_ROOT}/block ")
+
+    return sorted(devices)
+
+# procfs/sysfs files stay open between calls, they are re-read from offset 0 with pread
+# (the kernel regenerates the content on each read at offset 0), no fork and no open/close.
+# The sampler, display, fan and raid threads share them, _sysFilesLock guards open/read/close
+_sysFiles = {}
+_sysFilesLock = Lock()
+
+def _readSysFile(file, probe):
+    """
+    Read a procfs/sysfs file through a cached file descriptor, on non Armbian host the probe
+    file is read instead.  Output is split the same way as _readSytem.
+    """
+    if not isArmbian:
+        return _readSytem(None, probe, False)
+
+    with _sysFilesLock:
+        try:
+            fd = _sysFiles.get(file)
+            if fd is None:
+                fd = os.open(file, os.O_RDONLY)
+                _sysFiles[file] = fd
+
+            chunks = []
+            offset = 0
+            while True:
+                chunk = os.pread(fd, 4096, offset)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                offset += len(chunk)
+        except OSError:
+            fd = _sysFiles.pop(file, None)
+            if fd is not None:
+                os.close(fd)
+            print(f"ERROR reading {file} ")
+            return None
+
+    return _splitOutput(b"".join(chunks).decode())
+
+def _closeSysFile(path):
+    """
+    Close the cached descriptor of path and of the files below it, for a device that went away.
+    """
+    with _sysFilesLock:
+        for file in [file for file in _sysFiles if file == path or file.startswith(path + "/")]:
+            os.close(_sysFiles.pop(file))
+
+def _cachedSysFiles(path):
+    # Cached files below path
+    with _sysFilesLock:
+        return [file for file in _sysFiles if file.startswith(path + "/")]
 
 def checkPrivilege():
     """
@@ -72,23 +180,43 @@ def checkPrivilege():
 
 # Devices {'hd': ['sda', 'sdb', 'sdc', 'sdd', 'sde'], 'mnt': ['md0', 'mmcblk1p1']}
 # Sizes   {'sda': '1.0TB', 'sdb': '1.0TB', 'sdc': '1.0TB', 'sdd': '1.0TB', 'sde': '1.0TB', 'md0': '4.0TB', 'mmcblk1p1': '61.2GB'}
+def _devsizestr(kbval):
+    remainder = 0
+    suffixidx = 0
+    suffixlist = ["KB", "MB", "GB", "TB"]
+    kbval = int(kbval / 1000)
+    while kbval > 999 and suffixidx < len(suffixlist):
+        remainder = kbval % 1000
+        kbval  = int(kbval / 1000)
+        suffixidx = suffixidx + 1
+
+    return str(kbval)+"."+str(remainder)[0:1] + suffixlist[suffixidx]
+
+def _addDevice(devices, size, name, blocks, isPartition, mountPoints):
+    # Mounted devices are listed in 'mnt', whole sd/hd disks in 'hd'
+    if name.startswith("loop"):
+        return
+    if name in mountPoints:
+        devices['mnt'].append(name) 
+        size[name]=_devsizestr(blocks*512)
+    elif (name[0:2] == "sd" or name[0:2] == "hd") and not isPartition:
+        devices['hd'].append(name) 
+        size[name]=_devsizestr(blocks*512)
+
 def getDevices():
     hd   = []
     mnt  = []
     size = {}
 
-    def kbstr(kbval, wholenumbers = True):
-        remainder = 0
-        suffixidx = 0
-        suffixlist = ["KB", "MB", "GB", "TB"]
-        kbval = int(kbval / 1000)
-        while kbval > 999 and suffixidx < len(suffixlist):
-            remainder = kbval % 1000
-            kbval  = int(kbval / 1000)
-            suffixidx = suffixidx + 1
+    if _useSysfs():
+        # Disks, their partitions and arrays from sysfs, mounted ones from MOUNTINFO
+        mountPoints = _getMountPoints()
+
+        for name, blocks, isPartition in _getBlockDevices():
+            _addDevice({'hd':hd,'mnt':mnt}, size, name, blocks, isPartition, mountPoints)
+
+        return ({'hd':hd,'mnt':mnt}, size)
 
-        return str(kbval)+"."+str(remainder)[0:1] + suffixlist[suffixidx]
-        
     lines  = _readSytem("lsblk -lb", 
                         "probe/lsblk-l.txt", 
                         True)
@@ -96,18 +224,298 @@ def getDevices():
     for line in lines[1:]:
         if (len(line) == 7) and (line[5] != "loop"):
             mnt.append(line[0]) 
-            size[line[0]]=kbstr(int(line[3]))
+            size[line[0]]=_devsizestr(int(line[3]))
         else:
             if line[0][0:2] == "sd" or line[0][0:2] == "hd":    
                 hd.append(line[0]) 
-                size[line[0]]=kbstr(int(line[3]))
+                size[line[0]]=_devsizestr(int(line[3]))
         
     return ({'hd':hd,'mnt':mnt}, size)
 
+def updateDevices(devices, sizes, action, device):
+    """
+    Apply a block device hotplug event ("add", "change" or "remove") to the inventory returned
+    by getDevices.  Only the device of the event is read, its cached state is dropped.
+    """
+    for key in devices:
+        if device in devices[key]:
+            devices[key].remove(device)
+    sizes.pop(device, None)
+    _closeSysFile(f"{SYSFS_ROOT}/block/{device}")
+    statFile = _statFiles.pop(device, None)
+    if statFile is not None:
+        _closeSysFile(statFile)
+    _smartCache.pop(device, None)
+    for key in [key for key in _smartQueries if key[1] == device]:
+        _smartQueries.pop(key, None)
+    tempFile = _driveTempFiles.pop(device, None)
+    if tempFile is not None:
+        _closeSysFile(tempFile)
+
+    if action == "remove":
+        return
+
+    path = f"{SYSFS_ROOT}/class/block/{device}"
+    try:
+        with open(path + "/size", "r") as file:
+            blocks = int(file.read())
+    except (OSError, ValueError):
+        return
+
+    _addDevice(devices, sizes, device, blocks, os.path.exists(path + "/partition"), _getMountPoints())
+
+def updateMounts(devices, sizes):
+    """
+    Rebuild the inventory returned by getDevices when the mount table changed since the last
+    call : mounting a filesystem sends no uevent.  Return True when the inventory changed.
+    """
+    if not _useSysfs():
+        return False
+
+    mountPoints = _getMountPoints()
+    if mountPoints is updateMounts.mountPoints:
+        return False
+    updateMounts.mountPoints = mountPoints
+
+    newDevices, newSizes = getDevices()
+    if newDevices == devices and newSizes == sizes:
+        return False
+
+    for key in newDevices:
+        devices[key] = newDevices[key]
+    sizes.clear()
+    sizes.update(newSizes)
+    return True
+
+updateMounts.mountPoints = None
+
+def _parseUevent(data):
+    # add@/devices/.../block/sdb\0ACTION=add\0DEVPATH=...\0SUBSYSTEM=block\0DEVNAME=sdb\0DEVTYPE=disk\0...
+    event = {}
+    for field in data.split(b"\0")[1:]:
+        key, sep, value = field.partition(b"=")
+        if sep:
+            event[key.decode(errors = "replace")] = value.decode(errors = "replace")
+    return event
+
+def watch_hotplug(q):
+    """
+    Thread listening to the kernel uevents, each block device added, changed or removed is
+    published on q as ("hotplug", action, device).
+    """
+    if not isArmbian:
+        return
+
+    try:
+        # NETLINK_KOBJECT_UEVENT, multicast group 1 : kernel events
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, 15)
+        sock.bind((0, 1))
+    except OSError as e:
+        print(f"ERROR opening uevent socket {e} ")
+        return
+
+    while True:
+        try:
+            data = sock.recv(8192)
+        except OSError as e:
+            # ENOBUFS when events were lost, the RESCAN_PERIOD rescan catches up
+            print(f"ERROR reading uevent socket {e} ")
+            if e.errno != errno.ENOBUFS:
+                time.sleep(1)
+            continue
+
+        event = _parseUevent(data)
+        if event.get("SUBSYSTEM") != "block" or event.get("ACTION") not in ["add", "change", "remove"]:
+            continue
+        if event.get("DEVTYPE") not in ["disk", "partition"] or "DEVNAME" not in event:
+            continue
+
+        q.put(("hotplug", event["ACTION"], event["DEVNAME"].split("/")[-1]))
+
+# SMART attributes reported, the first integer of the raw value is kept
+SMART_ATTRS = ["1", "7", "194", "190", "196", "197", "198"]
+
+# Use smartctl JSON output (smartctl >= 7.0), the text table is parsed as a fallback
+smartJSON = True
+
+def _smartRawInt(raw):
+    # Raw values such as "35 (Min/Max 20/45)" or "7683h+12m+05.123s", keep the leading integer
+    digits = 0
+    while digits < len(raw) and raw[digits].isdigit():
+        digits += 1
+    return int(raw[:digits]) if digits > 0 else 0
+
+def _smartSumup(values):
+    values['warning'] = values.get('1', 0)+values.get('7', 0)
+    values['error']   = values.get('196', 0)+values.get('197', 0)+values.get('198', 0)
+    if '194' not in values:
+        values['194'] = values.get('190', 0)
+
+def _parseSmartJSON(out):
+    """
+    Parse the output of smartctl -A -l scttempsts -j.  The SCT temperature, when reported,
+    overrides attribute 194 and the power on hours are returned as 'hours'.
+    """
+    names = {}
+    values = {}
+
+    data = json.loads(out)
+
+    for attr in data.get('ata_smart_attributes', {}).get('table', []):
+        attrId = str(attr['id'])
+        if attrId in SMART_ATTRS:
+            names[attrId] = attr['name']
+            values[attrId] = _smartRawInt(attr['raw']['string'])
+
+    if 'current' in data.get('temperature', {}):
+        values['194'] = data['temperature']['current']
+
+    if 'hours' in data.get('power_on_time', {}):
+        values['hours'] = data['power_on_time']['hours']
+
+    _smartSumup(values)
+
+    return (names, values)
+
+def _parseSmartText(out):
+    """
+    Parse the attribute table of smartctl -A.  Only the lines of the attributes reported are split.
+    """
+    names = {}
+    values = {}
+
+    # ID# ATTRIBUTE_NAME FLAG VALUE WORST THRESH TYPE UPDATED WHEN_FAILED RAW_VALUE
+    for line in out.split("\n"):
+        attrId = line[:3].strip()
+        if attrId in SMART_ATTRS or attrId == "9":
+            line = line.split(None, 9)
+            if len(line) < 10:
+                continue
+            if attrId == "9":
+                values['hours'] = _smartRawInt(line[9])
+            else:
+                names[attrId] = line[1]
+                values[attrId] = _smartRawInt(line[9])
+
+    _smartSumup(values)
+
+    return (names, values)
+
+def _readDeviceSmartsAttr(device):
+    global smartJSON
+
+    if smartJSON and (isArmbian or os.path.exists(f"probe/{device}.smart.json")):
+        out  = _readSytemRaw(f"/usr/sbin/smartctl -d sat -A -l scttempsts -j /dev/{device}", 
+                             f"probe/{device}.smart.json", 
+                             True,
+                             smartTimeout)
+        try:
+            return _parseSmartJSON(out)
+        except (TypeError, ValueError, KeyError):
+            print(f"ERROR parsing smartctl JSON output of {device} ")
+            # smartctl older than 7.0 answers -j with the text table, stop asking for JSON
+            if out is not None and not out.lstrip().startswith("{"):
+                print(f"ERROR smartctl has no JSON output, using the text output ")
+                smartJSON = False
+
+    out  = _readSytemRaw(f"/usr/sbin/smartctl -d sat -A /dev/{device}", 
+                         f"probe/{device}.smart.txt", 
+                         True,
+                         smartTimeout)
+
+    return _parseSmartText(out)
+
+# Time to live (in seconds) of the SMART values read from a device
+smartTTL = 3600
+
+# Last SMART values read by device : {'names', 'values', 'time'}
+_smartCache = {}
+
+# smartctl is run on a bounded pool, each call is killed after smartTimeout seconds.  A device
+# that keeps failing is skipped for smartBackoff seconds, doubled on each failure up to
+# smartMaxBackoff
+smartWorkers    = 4
+smartTimeout    = 10
+smartBackoff    = 60
+smartMaxBackoff = 3600
+
+_smartPool = None
+
+# Query state by (kind, device) : {'future', 'failures', 'retry', 'late'}, 'late' is set while a
+# query that outlived the wait is still running, its result is harvested by the next call of the
+# same kind
+_smartQueries = {}
+
+def _queryDone(device, state, future, output):
+    # Result of a finished query in output, a failed query backs the device off
+    if future.exception() is None:
+        output[device] = future.result()
+        state['failures'] = 0
+        state['retry'] = 0
+    else:
+        state['failures'] += 1
+        backoff = min(smartBackoff * (2 ** (state['failures']-1)), smartMaxBackoff)
+        state['retry'] = time.monotonic() + backoff
+        print(f"ERROR querying {device}, retry in {backoff} sec ")
+
+def _queryDevices(kind, devices, query, timeout):
+    """
+    Run query(device) concurrently for all the devices and return the results of the queries that
+    completed.  kind names the query, each kind keeps its own state by device.  timeout is the longest a single query may take, the wait accounts for the queries
+    queued behind the smartWorkers busy ones.  Queries that never started are cancelled without
+    penalty, those still running are harvested by a later call.
+    """
+    global _smartPool
+
+    if _smartPool is None:
+        _smartPool = ThreadPoolExecutor(max_workers = smartWorkers, thread_name_prefix = "smartctl")
+
+    now = time.monotonic()
+    output = {}
+    futures = {}
+    for device in devices:
+        state = _smartQueries.setdefault((kind, device), {'future':None, 'failures':0, 'retry':0, 'late':False})
+
+        # Circuit breaker : still stuck from a previous call, or backing off
+        if state['future'] is not None and not state['future'].done():
+            continue
+        if state['late']:
+            state['late'] = False
+            _queryDone(device, state, state['future'], output)
+            continue
+        if now < state['retry']:
+            continue
+
+        state['future'] = _smartPool.submit(query, device)
+        futures[device] = state['future']
+
+    if futures:
+        waves = -(-len(futures) // smartWorkers)
+        wait(futures.values(), timeout = timeout * waves)
+
+    for device, future in futures.items():
+        state = _smartQueries[(kind, device)]
+        if future.done():
+            _queryDone(device, state, future, output)
+        elif future.cancel():
+            # Queued behind stuck queries, the device itself is not at fault
+            state['future'] = None
+        else:
+            state['late'] = True
+            print(f"ERROR querying {device}, still running ")
+
+    return output
+
 #  Smart Name  {'1': 'Raw_Read_Error_Rate', '7': 'Seek_Error_Rate', '194': 'Temperature_Celsius', '196': 'Reallocated_Event_Count', '197': 'Current_Pending_Sector', '198': 'Offline_Uncorrectable'}
-#  Smart Attrs {'sda': {'1': 0, '7': 0, '194': 35, '196': 0, '197': 0, '198': 0, 'warning': 0, 'error': 0}, 'sdb': {'1': 10, '7': 0, '194': 31, '196': 0, '197': 0, '198': 0, 'warning': 10, 'error': 0}, 'sdc': {'1': 0, '7': 0, '194': 31, '196': 0, '197': 0, '198': 0, 'warning': 0, 'error': 0}, 'sdd': {'1': 0, '7': 0, '194': 29, '196': 0, '197': 0, '198': 0, 'warning': 0, 'error': 0}, 'sde': {'1': 0, '7': 0, '194': 30, '196': 0, '197': 0, '198': 0, 'warning': 0, 'error': 0}}
-#  Smart Sumup {'maxTemp': 35, 'warning': 10, 'error': 0}
-def getDevicesSmartsAttr(devices):
+#  Smart Attrs {'sda': {'1': 0, '7': 0, '194': 35, '196': 0, '197': 0, '198': 0, 'warning': 0, 'error': 0, 'age': 0}, 'sdb': {'1': 10, '7': 0, '194': 31, '196': 0, '197': 0, '198': 0, 'warning': 10, 'error': 0, 'age': 0}, 'sdc': {'1': 0, '7': 0, '194': 31, '196': 0, '197': 0, '198': 0, 'warning': 0, 'error': 0, 'age': 0}, 'sdd': {'1': 0, '7': 0, '194': 29, '196': 0, '197': 0, '198': 0, 'warning': 0, 'error': 0, 'age': 0}, 'sde': {'1': 0, '7': 0, '194': 30, '196': 0, '197': 0, '198': 0, 'warning': 0, 'error': 0, 'age': 0}}
+#  Smart Sumup {'maxTemp': 35, 'minTemp': 29, 'warning': 10, 'error': 0, 'age': 0}
+def getDevicesSmartsAttr(devices, ttl = None):
+    """
+    Return the SMART attributes of the devices.  A device is only queried when its cached values
+    are older than ttl (smartTTL by default) and it is not in standby, a sleeping device keeps its
+    last known values rather than being spun up.  'age' gives how old the values are in seconds.
+    Devices are queried concurrently, a device that times out keeps its cached values (if any).
+    """
     names = {}
     values = {}
     sumup = {}
@@ -115,22 +523,40 @@ def getDevicesSmartsAttr(devices):
     sumup['minTemp'] = 200
     sumup['warning'] = 0
     sumup['error'] = 0
+    sumup['age'] = 0
+
+    if ttl is None:
+        ttl = smartTTL
+
+    def refresh(device):
+        # A device never read is queried even if sleeping, otherwise there is nothing to report
+        if device in _smartCache and _getDeviceStandby(device):
+            return None
+        return _readDeviceSmartsAttr(device)
 
+    now = time.monotonic()
+
+    stale = [device for device in devices 
+                if device not in _smartCache or now - _smartCache[device]['time'] >= ttl]
+
+    # standby check, JSON attributes read and text fallback : up to three smartctl calls per device
+    refreshed = _queryDevices("smart", stale, refresh, 3*smartTimeout)
+    for device in refreshed:
+        if refreshed[device] is not None:
+            devNames, devValues = refreshed[device]
+            _smartCache[device] = {'names':devNames, 'values':devValues, 'time':time.monotonic()}
+
+    now = time.monotonic()
 
     for device in devices:
-        values[device] = {}
+        cache = _smartCache.get(device)
+        if cache is None:
+            # Never read successfully, nothing to report
+            continue
 
-        lines  = _readSytem(f"/usr/sbin/smartctl -d sat -A /dev/{device}", 
-                            f"probe/{device}.smart.txt", 
-                            True)
-        
-        for line in lines[5:]:
-            if line[0] in ["1", "7", "194", "190", "196", "197", "198"]:
-                names[line[0]] = line[1]           
-                values[device][line[0]] = int(line[9]) 
-                                            
-        values[device]['warning'] = values[device]['1']+values[device]['7']
-        values[device]['error']   = values[device]['196']+values[device]['197']+values[device]['198']
+        names.update(cache['names'])
+        values[device] = dict(cache['values'])
+        values[device]['age'] = int(now - cache['time'])
 
         if values[device]['194'] > sumup['maxTemp']: 
             sumup['maxTemp']= values[device]['194']
@@ -141,31 +567,104 @@ def getDevicesSmartsAttr(devices):
         sumup['warning'] += values[device]['warning'] 
         sumup['error']   += values[device]['error'] 
 
+        if values[device]['age'] > sumup['age']:
+            sumup['age'] = values[device]['age']
+
     
     return (names, values, sumup)                
 
-#   Standby {'sda': False, 'sdb': True, 'sdc': True, 'sdd': True, 'sde': True}
-def getDevicesStandby(devices):
-    values = {}
+# drivetemp hwmon temperature file by device, hwmon devices are scanned again at most every
+# DRIVETEMP_SCAN seconds while a device has none (driver not loaded, device just plugged)
+DRIVETEMP_SCAN = 60
+_driveTempFiles = {}
+_driveTempScan  = None
 
-    for device in devices:
-        values[device] = {}
+def _getDriveTempFiles():
+    files = {}
+    root = f"{SYSFS_ROOT}/class/hwmon"
+    try:
+        hwmons = os.listdir(root)
+    except OSError:
+        return files
+
+    for hwmon in hwmons:
+        try:
+            with open(f"{root}/{hwmon}/name") as f:
+                if f.read().strip() != "drivetemp":
+                    continue
+            # hwmon device is the SCSI device of the drive, its block directory names the disk
+            for device in os.listdir(f"{root}/{hwmon}/device/block"):
+                files[device] = f"{root}/{hwmon}/temp1_input"
+        except OSError:
+            continue
+    return files
 
-        lines  = _readSytem(f"/usr/sbin/smartctl -d sat -n standby,0 /dev/{device}", 
-                    f"probe/{device}.active.txt",
-                    True)
-        
-        line = lines[2]
+def getDevicesTemp(devices):
+    """
+    Return the temperature of the devices, read from the drivetemp hwmon driver : a few bytes,
+    no fork, no smartctl.  A device without the driver gets its cached SMART attribute 194, a
+    device with neither is left out.
+    """
+    global _driveTempFiles, _driveTempScan
 
-        values[device] = line[3] == "STANDBY"
+    if isArmbian and any(device not in _driveTempFiles for device in devices):
+        now = time.monotonic()
+        if _driveTempScan is None or now - _driveTempScan >= DRIVETEMP_SCAN:
+            _driveTempScan  = now
+            _driveTempFiles = _getDriveTempFiles()
 
-    return (values)                
+    temps = {}
+    for device in devices:
+        if isArmbian and device in _driveTempFiles:
+            lines = _readSysFile(_driveTempFiles[device], None)
+            if lines:
+                temps[device] = int(lines[0][0])/1000
+                continue
+            # hwmon device gone (drive swapped, driver reloaded), scan again on the next call
+            _driveTempFiles.pop(device, None)
+            _driveTempScan = None
+        # The display thread drops the cache of unplugged devices, read the entry once
+        cache = _smartCache.get(device)
+        if cache is not None:
+            temps[device] = cache['values']['194']
+
+    return temps
+
+def _getDeviceStandby(device):
+    # An awake drive only gets the smartctl banner, a sleeping one "Device is in STANDBY mode"
+    out = _readSytemRaw(f"/usr/sbin/smartctl -d sat -n standby,0 /dev/{device}", 
+                f"probe/{device}.active.txt",
+                True,
+                smartTimeout)
+    if out is None:
+        return False
+
+    return "STANDBY" in out or "SLEEP" in out
 
-#   Mapping  {'sda': ('ata', 1), 'sdb': ('ata', 2), 'sdc': ('ata', 3), 'sdd': ('ata', 4), 'sde': ('ata', 5)}
+#   Standby {'sda': False, 'sdb': True, 'sdc': True, 'sdd': True, 'sde': True}
+def getDevicesStandby(devices):
+    """
+    Return the standby state of the devices, queried concurrently.  Devices that did not answer
+    within smartTimeout are left out.
+    """
+    return _queryDevices("standby", devices, _getDeviceStandby, smartTimeout)
+
+#   Mapping  {'sda': 'ata1', 'sdb': 'ata2', 'sdc': 'ata3', 'sdd': 'ata4', 'sde': 'ata5'}
 def getDevicesMapping(devices): #return a disc by device with its ATA mapping
     mapping = {}
     lines = []
     
+    if _useSysfs():
+        # /sys/block/sda/device -> /sys/devices/platform/f8000000.pcie/.../ata1/host0/target0:0:0/0:0:0:0
+        for dev in devices:
+            path = os.path.realpath(f"{SYSFS_ROOT}/block/{dev}/device")
+            for part in path.split("/"):
+                if part[0:3] == "ata" and part[3:].isdigit():
+                    mapping[dev] = part
+                    break
+
+        return mapping
+
     for dev in devices: 
         line = _readSytem(f"/usr/bin/udevadm info -q path -p /sys/block/{dev}", 
                 f"probe/udevadm.txt",
@@ -185,185 +684,457 @@ def getDevicesMapping(devices): #return a disc by device with its ATA mapping
     return mapping
 
 #   Activity {'md0': {'read': 26914, 'write': 224}, 'mmcblk1p1': {'read': 956173, 'write': 7278577}}
+_statFiles = {}
+
 def getDeviceActivty(devices):
 
     output = {}
     
     for device in devices:
 
-        file = f"/sys/block/{device}/stat"
-        if not os.path.exists(file):
-            file = f"/sys/block/{device[:-1]}/stat"
+        file = _statFiles.get(device)
+        if file is None:
+            file = f"{SYSFS_ROOT}/block/{device}/stat"
             if not os.path.exists(file):
-                file = f"/sys/block/{device[:-2]}/stat"
+                file = f"{SYSFS_ROOT}/block/{device[:-1]}/stat"
                 if not os.path.exists(file):
-                    continue
-
-        lines  = _readSytem(f"cat {file}", 
-                            f"probe/{device}.stat.txt", 
-                            True)
+                    file = f"{SYSFS_ROOT}/block/{device[:-2]}/stat"
+                    if not os.path.exists(file):
+                        continue
+            _statFiles[device] = file
+
+        lines  = _readSysFile(file, 
+                              f"probe/{device}.stat.txt")
+        if not lines:
+            continue
         line = lines[0]
         if len(line) >= 11:
             output[device] = {"read":int(line[2]), "write":int(line[6])}   
 
     return output
 
-#  Usage    {'mmcblk1p1': {'free': '58G', 'total': '61G', 'percent': 4}, 'md0': {'free': '3.8T', 'total': '4.0T', 'percent': 1}}
+# Mount point by device, read from MOUNTINFO and refreshed when poll() reports a change of the
+# mount table.  _mountFile is the (path, fd) the poller watches
+_mountPoints = None
+_mountPoller = None
+_mountFile   = None
+
+def _unescapeMount(path):
+    # Spaces, tabs, newlines and backslashes are octal escaped (\040)
+    idx = path.find("\\")
+    while idx >= 0 and idx+3 < len(path):
+        path = path[:idx] + chr(int(path[idx+1:idx+4], 8)) + path[idx+4:]
+        idx = path.find("\\", idx+1)
+    return path
+
+def _getMountPoints():
+    global _mountPoints, _mountPoller, _mountFile
+
+    if _mountFile is None or _mountFile[0] != MOUNTINFO:
+        if _mountFile is not None:
+            os.close(_mountFile[1])
+        _mountFile   = (MOUNTINFO, os.open(MOUNTINFO, os.O_RDONLY))
+        _mountPoller = select.poll()
+        _mountPoller.register(_mountFile[1], select.POLLERR | select.POLLPRI)
+    elif _mountPoints is not None and len(_mountPoller.poll(0)) == 0:
+        return _mountPoints
+
+    # 36 35 98:0 / /mnt/md0 rw,relatime shared:1 - ext4 /dev/md0 rw,stripe=512
+    mountPoints = {}
+    with open(MOUNTINFO, "r") as mountinfo:
+        for line in mountinfo:
+            fields = line.split()
+            if "-" not in fields:
+                continue
+            sep = fields.index("-")
+            source = fields[sep+2] if sep+2 < len(fields) else ""
+            if not source.startswith("/dev/"):
+                continue
+            device = source[source.rfind("/")+1:]
+            # Keep the mount of the filesystem root rather than bind mounts of a sub directory
+            if device not in mountPoints and fields[3] == "/":
+                mountPoints[device] = _unescapeMount(fields[4])
+
+    _mountPoints = mountPoints
+    return _mountPoints
+
+def _dfSize(value):
+    # df -H sizes : "4,0T", "61G", "275k"
+    value = value.replace(",",".")
+    factor = 1
+    for unit in ["k", "M", "G", "T", "P"]:
+        factor = factor * 1000
+        if value.upper().endswith(unit.upper()):
+            return int(float(value[:-1]) * factor)
+    return int(float(value))
+
+#  Usage    {'mmcblk1p1': {'free': 58000000000, 'total': 61000000000, 'percent': 4}, 'md0': {'free': 3800000000000, 'total': 4000000000000, 'percent': 1}}
 def getDeviceUsage(devices): 
-
+    """
+    Return the size, free space (bytes) and percentage used of the mounted devices.  Only the
+    mount points of the devices are queried with statvfs, see sizestr to format the sizes.
+    """
     output = {}
     
-    lines  = _readSytem(f"df -H", 
-                    f"probe/df.txt", 
-                    True)
+    if not isArmbian:
+        lines  = _readSytem(f"df -H", 
+                        f"probe/df.txt", 
+                        True)
 
-    for line in lines[1:]:
-        tmpidx = line[0].rfind("/")
-        if tmpidx >= 0:
-            curdev = line[0][tmpidx+1:]
-        else:
+        for line in lines[1:]:
+            tmpidx = line[0].rfind("/")
+            if tmpidx >= 0:
+                curdev = line[0][tmpidx+1:]
+            else:
+                continue
+            
+            if curdev not in devices:          
+                continue        
+            
+            output[curdev] = {}
+            output[curdev]["free"]         = _dfSize(line[3])
+            output[curdev]["total"]        = _dfSize(line[1])
+            output[curdev]["percent"]      = int(line[4][0:-1])
+
+        return output
+
+    mountPoints = _getMountPoints()
+
+    for curdev in devices:
+        if curdev not in mountPoints:
             continue
-        
-        if curdev not in devices:          
-            continue        
-        
+
+        try:
+            stat = os.statvfs(mountPoints[curdev])
+        except OSError:
+            continue
+
+        # Same computation as df : used / (used + available) rounded up
+        used  = (stat.f_blocks - stat.f_bfree) * stat.f_frsize
+        avail = stat.f_bavail * stat.f_frsize
+
         output[curdev] = {}
-        output[curdev]["free"]         = line[3].replace(",",".")
-        output[curdev]["total"]        = line[1].replace(",",".")
-        output[curdev]["percent"]      = int(line[4][0:-1])
+        output[curdev]["free"]         = avail
+        output[curdev]["total"]        = stat.f_blocks * stat.f_frsize
+        output[curdev]["percent"]      = math.ceil(100 * used / (used + avail)) if used + avail > 0 else 0
 
     return output
 
-#  Summary  {'md0': {'type': 'raid5', 'active': 'active', 'devices': ['sde', 'sdd', 'sdb', 'sdc', 'sda'], 'disc': (5, 5, 'UUUUU'), 'status': 'clean', 'recovery': None}}
-def getRAID():           # List RAID and details (do no spin up drive )
-    hddList = []
+def _raidStatus(nbDiscTotal, nbDiscInUsed):
+    if nbDiscTotal == nbDiscInUsed:
+        return 'clean'
+    elif nbDiscTotal == nbDiscInUsed+1:
+        return 'degraded'
+    return 'error'
+
+def _getRAIDmdstat():
+    """
+    Parse every array of /proc/mdstat.  Tokens are located by their shape rather than their
+    position, so "(auto-read-only)", spares "(S)" and faulty "(F)" members are handled.
+    """
     output = {}
 
-    lines  = _readSytem(f"cat /proc/mdstat", 
-                        f"probe/mdstat.txt", 
-                        True)
+    lines  = _readSysFile("/proc/mdstat", 
+                          "probe/mdstat.txt")
     
     # Check first line, and drop it
-    if lines[0][0] != "Personalities":
+    if not lines or lines[0][0] != "Personalities":
         print("ERROR : processing /proc/mdstat")
         return None
-    lines = lines[1:]
 
-    # process then next lines
-    
-    # process first line
-    devName  = lines[0][0]
-    state    = lines[0][2]
-    if (state == "active"):
-        if lines[0][3].find("raid")>=0:
-            raidType = lines[0][3]
-            hddctr = 4
-        else:
-            raidType = lines[0][4]
-            hddctr = 5
-    else:    
-        raidType = "Error"
-        hddctr = 3
-    
-    while hddctr < len(lines[0]):
-        tmpDevice = lines[0][hddctr]
-        tmpidx = tmpDevice.find("[")
-        if tmpidx >= 0:
-            '''  INDEX is useless skip it
-            tmpidx2 = tmpDevice.find("]")
-            tmpId = int(tmpDevice[tmpidx+1:tmpidx2])
-            '''
-            tmpDevice = tmpDevice[0:tmpidx]
-        
-        hddList.append(tmpDevice)
-        hddctr = hddctr + 1
+    idx = 1
+    while idx < len(lines):
+        line = lines[idx]
+        if len(line) < 3 or line[1] != ":":
+            idx += 1
+            continue
 
-    
-    if len(lines[1]) > 5:    
-        # process second line
-        nbDiscTotal = int(lines[1][10][1:-1].split("/")[0])
-        nbDiscInUsed = int(lines[1][10][1:-1].split("/")[1])
-        disc = lines[1][11][1:-1]
-    else:
-        nbDiscTotal = len(hddList)
+        # md0 : active (auto-read-only) raid5 sdb[5] sda[1] sdc[2] sdd[3]
+        devName  = line[0]
+        state    = line[2]
+        raidType = "----"
+        hddList  = []
+        members  = {}
+        for token in line[3:]:
+            if token.find("[") >= 0:
+                device = token[0:token.find("[")]
+                hddList.append(device)
+                members[device] = 'faulty' if token.endswith("(F)") else 'spare' if token.endswith("(S)") else 'in_sync'
+            elif not token.startswith("("):
+                raidType = token
+
+        # 3906521088 blocks super 1.2 level 5, 512k chunk, algorithm 2 [5/4] [_UUUU]
+        nbDiscTotal  = len(hddList)
         nbDiscInUsed = 0
         disc = ""
+        # bitmap: 0/8 pages [0KB], 65536KB chunk
+        # [==>..................]  recovery = 12.6% (37043392/292945152) finish=127.5min speed=33440K/sec
+        recovery = None
+        status   = 'inactive' if state == 'inactive' else 'unknown'
+
+        idx += 1
+        while idx < len(lines) and not (len(lines[idx]) >= 3 and lines[idx][1] == ":"):
+            tokens = lines[idx]
+            if tokens[0] == "unused":
+                break
+            for tidx, token in enumerate(tokens):
+                if token.startswith("[") and token.endswith("]") and token.find("/") > 0 and token[1].isdigit():
+                    nbDiscTotal  = int(token[1:-1].split("/")[0])
+                    nbDiscInUsed = int(token[1:-1].split("/")[1])
+                    if state != 'inactive':
+                        status = _raidStatus(nbDiscTotal, nbDiscInUsed)
+                elif token.startswith("[") and token.endswith("]") and token.strip("[]U_") == "":
+                    disc = token[1:-1]
+                elif token in ["recovery", "resync", "reshape", "check", "repair"] and tidx+1 < len(tokens) and tokens[tidx+1] == "=":
+                    status = token
+                    recovery = {'percentage':0.0, 'duration':0.0, 'speed':0}
+                    recovery['percentage'] = float(tokens[tidx+2][:-1])
+                elif token.startswith("finish=") and recovery is not None:
+                    recovery['duration'] = float(token.split("=")[1][:-3])
+                elif token.startswith("speed=") and recovery is not None:
+                    recovery['speed'] = int(token.split("=")[1][:-5])
+            idx += 1
+
+        # The probe file holds several captures of the same array, keep the first one
+        if devName in output:
+            continue
 
+        output[devName] = { 'type'      : raidType, 
+                            'state'     : state, 
+                            'devices'   : hddList, 
+                            'disc'      : (nbDiscTotal,nbDiscInUsed,disc), 
+                            'status'    : status,
+                            'recovery'  : recovery,
+                            'degraded'  : nbDiscTotal-nbDiscInUsed,
+                            'mismatch'  : 0,
+                            'members'   : members}
 
-    # process third line
-    recovery = None
-    status = 'unknown'
-    if len(lines[2]) > 1:
-        if lines[2][0] == "bitmap:": 
-            if nbDiscTotal == nbDiscInUsed:
-                status = 'clean'
-            elif nbDiscTotal == nbDiscInUsed+1:
-                status = 'degraded'
-            else:
-                status = 'error'
-            
+    return output
 
-        if lines[2][1] == "recovery" or lines[2][1] == "resync": 
-            status = lines[2][1]
-            percentage = float(lines[2][3][:-1])
-            duration = float(lines[2][5].split("=")[1][:-3])
-            speed =  int(lines[2][6].split("=")[1][:-5])
-            recovery = {'percentage':percentage,'duration':duration, 'speed':speed}
-        
+def _readSysAttr(file, optional = False):
+    # optional : attribute some arrays do not have (raid0/linear lack degraded, sync_action...),
+    # None without an error when it does not exist
+    if optional and not os.path.exists(file):
+        return None
+    lines = _readSysFile(file, None)
+    if not lines:
+        return None
+    return " ".join(lines[0])
 
-    output[devName] = { 'type'      : raidType, 
-                        'state'     : state, 
-                        'devices'   : hddList, 
-                        'disc'      : (nbDiscTotal,nbDiscInUsed,disc), 
-                        'status'    : status,
-                        'recovery'  : recovery}
+def _getRAIDsysfs(devName):
+    """
+    Read one array from /sys/block/<md>/md.  None if the array went away while being read.
+    """
+    try:
+        return _readRAIDsysfs(devName)
+    except (OSError, ValueError):
+        # Array stopped or removed while being read
+        return None
 
-    return output
+def _readRAIDsysfs(devName):
+    base = f"{SYSFS_ROOT}/block/{devName}/md"
 
-#  CPU    {'load': 83, 'temp': 43.888, 'loadByCPU': [100, 0, 100, 100, 100, 100]}
-def getCPUusage(sleepsec = 1):
+    arrayState = _readSysAttr(f"{base}/array_state")
+    if arrayState is None:
+        return None
 
-    def getCPUtemp():
+    raidType   = _readSysAttr(f"{base}/level") or "----"
+    nbDisc     = int(_readSysAttr(f"{base}/raid_disks") or 0)
+    degraded   = int(_readSysAttr(f"{base}/degraded", True) or 0)
+    mismatch   = int(_readSysAttr(f"{base}/mismatch_cnt", True) or 0)
+    syncAction = _readSysAttr(f"{base}/sync_action", True) or "idle"
 
-        lines  = _readSytem(f"cat /sys/class/thermal/thermal_zone0/temp", 
-                            f"probe/temp.txt", 
-                            True)         
+    # Members : dev-sda/{state,slot}, slot is "none" for a spare
+    hddList = []
+    members = {}
+    slots   = ['_'] * nbDisc
+    with os.scandir(base) as entries:
+        for entry in entries:
+            if not entry.name.startswith("dev-"):
+                continue
+            device = entry.name[4:]
+            memberState = _readSysAttr(f"{base}/{entry.name}/state")
+            slot = _readSysAttr(f"{base}/{entry.name}/slot")
+            if memberState is None:
+                continue
+            hddList.append(device)
+            members[device] = memberState
+            if slot is not None and slot.isdigit() and int(slot) < nbDisc and memberState.find("in_sync") >= 0:
+                slots[int(slot)] = 'U'
+
+    # Members removed from the array
+    for file in _cachedSysFiles(base):
+        entry = file[len(base)+1:].split("/")[0]
+        if entry.startswith("dev-") and entry[4:] not in members:
+            _closeSysFile(f"{base}/{entry}")
+
+    if arrayState in ["inactive", "clear"]:
+        state  = 'inactive'
+        status = 'inactive'
+    else:
+        state  = 'active'
+        status = _raidStatus(nbDisc, nbDisc-degraded)
 
-        return float(int(lines[0][0])/1000)
+    # sync_completed : "done / total" in sectors, sync_speed in K/sec
+    recovery = None
+    if syncAction in ["resync", "recover", "reshape", "check", "repair"]:
+        status = "recovery" if syncAction == "recover" else syncAction
+        completed = (_readSysAttr(f"{base}/sync_completed") or "none").split("/")
+        speed = _readSysAttr(f"{base}/sync_speed") or "none"
+        speed = int(speed) if speed.isdigit() else 0
+        recovery = {'percentage':0.0, 'duration':0.0, 'speed':speed}
+        if len(completed) == 2 and int(completed[1]) > 0:
+            done  = int(completed[0])
+            total = int(completed[1])
+            recovery['percentage'] = round(100*done/total, 1)
+            if speed > 0:
+                recovery['duration'] = round((total-done)/2/speed/60, 1)
+
+    return { 'type'      : raidType, 
+             'state'     : state, 
+             'devices'   : hddList, 
+             'disc'      : (nbDisc, nbDisc-degraded, "".join(slots)), 
+             'status'    : status,
+             'recovery'  : recovery,
+             'degraded'  : degraded,
+             'mismatch'  : mismatch,
+             'members'   : members}
+
+#  Summary  {'md0': {'type': 'raid5', 'state': 'active', 'devices': ['sde', 'sdd', 'sdb', 'sdc', 'sda'], 'disc': (5, 5, 'UUUUU'), 'status': 'clean', 'recovery': None, 'degraded': 0, 'mismatch': 0, 'members': {'sde': 'in_sync', 'sdd': 'in_sync', 'sdb': 'in_sync', 'sdc': 'in_sync', 'sda': 'in_sync'}}}
+def getRAID():           # List RAID and details (do no spin up drive )
+    """
+    Return every md array, read from sysfs on Armbian and from the mdstat probe otherwise.
+    None when there is no array.
+    """
+    if not isArmbian:
+        return _getRAIDmdstat() or None
 
-    def getCPUusageSnapshot():
-        
-        output = {}     
-        cpuCtr = 0
+    output = {}
+    try:
+        with os.scandir(f"{SYSFS_ROOT}/block") as entries:
+            names = sorted(entry.name for entry in entries if entry.name.startswith("md"))
+    except OSError:
+        return None
+
+    # Arrays stopped since the last call
+    for file in _cachedSysFiles(f"{SYSFS_ROOT}/block"):
+        devName = file[len(SYSFS_ROOT)+len("/block/"):].split("/")[0]
+        if devName.startswith("md") and devName not in names:
+            _closeSysFile(f"{SYSFS_ROOT}/block/{devName}")
+
+    for devName in names:
+        raid = _getRAIDsysfs(devName)
+        if raid is not None:
+            output[devName] = raid
+
+    return output or None
+
+def _watchFiles():
+    # /proc/mdstat and the array_state / sync_action of every array raise POLLPRI on change
+    files = ["/proc/mdstat"]
+    for md in sorted(Path(f"{SYSFS_ROOT}/block").glob("md*")):
+        for attr in ["array_state", "sync_action"]:
+            if (md / "md" / attr).exists():
+                files.append(str(md / "md" / attr))
+    return files
+
+def watch_raid(q):
+    """
+    Thread publishing the RAID summary on q as ("raid", getRAID()) at start and each time it
+    changes.  The thread sleeps in poll() on /proc/mdstat and the md sysfs attributes, nothing
+    is read while the arrays do not change.
+    """
+    prevRAID = getRAID()
+    q.put(("raid", prevRAID))
+
+    if not isArmbian:
+        return
+
+    poller = select.poll()
+    watched = {}
+
+    while True:
+        try:
+            files = _watchFiles()
+            for file in list(watched.keys()):
+                if file not in files:
+                    poller.unregister(watched[file])
+                    os.close(watched.pop(file))
+            for file in files:
+                if file not in watched:
+                    try:
+                        fd = os.open(file, os.O_RDONLY)
+                    except OSError:
+                        continue
+                    try:
+                        # The notification is armed by reading the file
+                        os.pread(fd, 4096, 0)
+                    except OSError:
+                        os.close(fd)
+                        continue
+                    watched[file] = fd
+                    poller.register(fd, select.POLLPRI | select.POLLERR)
+
+            for fd, event in poller.poll():
+                # Read again to re-arm the notification
+                try:
+                    os.pread(fd, 4096, 0)
+                except OSError:
+                    pass
+
+            curRAID = getRAID()
+            if curRAID != prevRAID:
+                q.put(("raid", curRAID))
+                prevRAID = curRAID
+        except Exception as e:
+            # Keep watching, the next event reads the arrays again
+            print(f"ERROR watching the RAID arrays {e} ")
+            time.sleep(1)
 
-        # user, nice, system, idle, iowait, irc, softirq, steal, guest, guest nice
-        lines  = _readSytem(f"cat /proc/stat", 
-                            f"probe/stat.txt", 
-                            True)            
+#  CPU    {'load': 83, 'temp': 43.888, 'loadByCPU': [100, 0, 100, 100, 100, 100]}
+def getCPUtemp():
 
-        for line in lines:
-            if len(line) < 3:
-                cpuCtr = cpuCtr +1
-                continue
+    lines  = _readSysFile(f"{SYSFS_ROOT}/class/thermal/thermal_zone0/temp", 
+                          "probe/temp.txt")         
+    if not lines:
+        return 0.0
 
-            if line[0][:3] == "cpu":
-                idle = 0
-                total = 0
-                colctr = 1
-                while colctr < len(line):
-                    curval = int(line[colctr])
-                    if colctr == 4 or colctr == 5:
-                        idle = idle + curval
-                    total = total + curval
-                    colctr = colctr + 1
-                if total > 0:
-                    output[line[0]] = {"total": total, "idle": idle}
-            cpuCtr = cpuCtr +1
+    return float(int(lines[0][0])/1000)
 
-        return output
+def _getCPUusageSnapshot():
     
+    output = {}     
+    cpuCtr = 0
+
+    # user, nice, system, idle, iowait, irc, softirq, steal, guest, guest nice
+    lines  = _readSysFile("/proc/stat", 
+                          "probe/stat.txt")            
+
+    for line in lines:
+        if len(line) < 3:
+            cpuCtr = cpuCtr +1
+            continue
+
+        if line[0][:3] == "cpu":
+            idle = 0
+            total = 0
+            colctr = 1
+            while colctr < len(line):
+                curval = int(line[colctr])
+                if colctr == 4 or colctr == 5:
+                    idle = idle + curval
+                total = total + curval
+                colctr = colctr + 1
+            if total > 0:
+                output[line[0]] = {"total": total, "idle": idle}
+        cpuCtr = cpuCtr +1
+
+    return output
+
+def _getCPUload(curUsageA, curUsageB):
+
     def getLoad (cpuName, A, B):
-        if A[cpuName]["total"] == B[cpuName]["total"]:
+        if cpuName not in A or A[cpuName]["total"] == B[cpuName]["total"]:
             return 0
         else:
             total = B[cpuName]["total"]-A[cpuName]["total"]
@@ -371,28 +1142,73 @@ def getCPUusage(sleepsec = 1):
             return int(100*(total-idle)/(total))   
 
     output = {}
-    curUsageA = getCPUusageSnapshot()
-    time.sleep(sleepsec)
-    curUsageB = getCPUusageSnapshot()
-
     output['load'] = getLoad('cpu',curUsageA, curUsageB )
-    output['temp'] = getCPUtemp()
     output['loadByCPU'] = []
 
-    for cpuName in curUsageA:
+    for cpuName in curUsageB:
         if cpuName == 'cpu': continue
         output['loadByCPU'].append(getLoad(cpuName,curUsageA, curUsageB ))
 
     return output
 
+# Latest sample published by the sampler thread, replaced as a whole so readers never see
+# a partially updated dict
+cpuSample = None
+
+def _cpuSampler(period):
+    global cpuSample
+
+    prevUsage = None
+    while True:
+        try:
+            curUsage = _getCPUusageSnapshot()
+            if prevUsage is not None and curUsage is not None:
+                sample = _getCPUload(prevUsage, curUsage)
+                sample['temp'] = getCPUtemp()
+                cpuSample = sample
+        except Exception as e:
+            # Unreadable /proc/stat, the next sample starts from a new snapshot
+            print(f"ERROR sampling the CPU load {e} ")
+            curUsage = None
+
+        prevUsage = curUsage
+        time.sleep(period)
+
+def startCPUSampler(period = 1):
+    """
+    Start the background thread that keeps the previous /proc/stat snapshot and publishes
+    the load delta every period seconds.  Once started getCPUusage returns immediately.
+    """
+    if startCPUSampler.thread is None:
+        startCPUSampler.thread = Thread(target = _cpuSampler, args = (period, ), daemon = True)
+        startCPUSampler.thread.start()
+startCPUSampler.thread = None
+
+def getCPUusage(sleepsec = 1):
+    """
+    Return the CPU load over the last sampling period.  Without the sampler thread two
+    /proc/stat snapshots are taken sleepsec apart.
+    """
+    sample = cpuSample
+    if sample is not None:
+        return {'load':sample['load'], 'temp':sample['temp'], 'loadByCPU':list(sample['loadByCPU'])}
+
+    curUsageA = _getCPUusageSnapshot()
+    time.sleep(sleepsec)
+    curUsageB = _getCPUusageSnapshot()
+
+    output = _getCPUload(curUsageA, curUsageB)
+    output['temp'] = getCPUtemp()
+
+    return output
+
 #  RAM    {'free': 89, 'SizeGB': 4}
 def getRAMusage():
     totalRam = 0
     totalFree = 0
     
-    lines  = _readSytem(f"cat /proc/meminfo", 
-                        f"probe/meminfo.txt", 
-                        True)
+    lines  = _readSysFile("/proc/meminfo", 
+                          "probe/meminfo.txt")
      
 
     for line in lines:
@@ -455,6 +1271,22 @@ def kbstr(kbval, wholenumbers = True):
         return str(kbval)+remainderstr + suffixlist[suffixidx]
 
 
+def sizestr(value):
+    """
+    Scale bytes the way df -H does, powers of 1000 with one decimal below 10
+    """
+    suffixlist = ["B", "k", "M", "G", "T", "P"]
+    suffixidx = 0
+    value = float(value)
+    while value >= 999.5 and suffixidx < len(suffixlist)-1:
+        value = value / 1000
+        suffixidx = suffixidx + 1
+
+    if value < 9.95 and suffixidx > 0:
+        return f"{value:.1f}{suffixlist[suffixidx]}"
+    return f"{value:.0f}{suffixlist[suffixidx]}"
+
+
 def get_size(bytes, suffix="B"):
      """
      Scale bytes to its proper format- KB, MB, GB, TB and PB